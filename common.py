@@ -149,6 +149,58 @@ def turnAngle(p, d):
   else: return 180
 
 
+def findCycle(make_start, step, fingerprint = lambda x: x, max_steps = None):
+  """
+  Brent's cycle-finding algorithm, for simulations whose states
+  eventually repeat.
+
+  make_start() returns a new copy of the initial state.
+  step(state) returns the next state. It may modify state in place
+    and return it.
+  fingerprint(state) returns a hashable value that is equal for two
+    states if and only if the states are equal.
+
+  Returns (mu, lam): the state after mu steps is the first one that
+  repeats, and from then on the states repeat every lam steps.
+  Returns None if no repeat is found within max_steps steps.
+
+  Unlike remembering every state in a dict, this keeps at most two
+  states and one fingerprint at a time, at the cost of running the
+  simulation two or three times as many steps.
+  """
+  # find lam: the hare walks ahead, and the tortoise jumps to the hare
+  # every time the distance between them reaches a power of 2
+  power = lam = 1
+  hare = make_start()
+  tortoise_fp = fingerprint(hare)
+  hare = step(hare)
+  steps = 1
+  while fingerprint(hare) != tortoise_fp:
+    if max_steps != None and steps >= max_steps:
+      return None
+    if power == lam:
+      tortoise_fp = fingerprint(hare)
+      power *= 2
+      lam = 0
+    hare = step(hare)
+    steps += 1
+    lam += 1
+
+  # find mu: start two states lam steps apart and walk them together
+  # until they meet
+  tortoise = make_start()
+  hare = make_start()
+  for _ in range(lam):
+    hare = step(hare)
+  mu = 0
+  while fingerprint(tortoise) != fingerprint(hare):
+    tortoise = step(tortoise)
+    hare = step(hare)
+    mu += 1
+
+  return (mu, lam)
+
+
 def testPasteGrid():
   src = createGrid(3, 5, True, 'o')
   dest = createGrid(10, 10, False, '.')
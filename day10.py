@@ -155,12 +155,232 @@ def part2(grid):
   print(f'part2 {count}')
 
 
+def findStartCell(grid):
+  """
+  Return (row, col) of 'S' without copying the grid, or None.
+  """
+  for r, row in enumerate(grid):
+    c = row.find('S')
+    if c >= 0:
+      return (r, c)
+  return None
+
+
+def startDirections(grid, r, c):
+  """
+  Return the two directions out of the start cell at (r, c) that the
+  loop through it uses, in order (UP, RIGHT, DOWN, LEFT), or None if
+  there is no such loop.
+
+  Other pipes next to S may point at it without being part of the loop,
+  so each neighbor that connects back is followed until the path either
+  returns to S or dead-ends. Each pipe has exactly two openings, so a
+  path that leaves S can't circle anywhere else.
+  """
+  row_count = len(grid)
+  width = len(grid[0])
+  for first in (UP, RIGHT, DOWN, LEFT):
+    (nr, nc) = (r, c)
+    d = first
+    while True:
+      (nr, nc) = move(nr, nc, d)
+      if not (0 <= nr < row_count and 0 <= nc < width):
+        break
+      if nr == r and nc == c:
+        return tuple(sorted((first, invDir(d))))
+      key = (grid[nr][nc], invDir(d))
+      if key not in goes:
+        break
+      d = goes[key]
+  return None
+
+
+def traceLoop(grid):
+  """
+  Follow the loop through 'S' once, reading the grid in place.
+  Returns (loop_length, enclosed_count).
+
+  The enclosed area comes from the shoelace formula, which for unit
+  steps reduces to summing col * row_step. The loop passes through the
+  centers of the cells, so Pick's theorem (area = inside + boundary/2 - 1)
+  gives the number of cells inside it without building a fill grid.
+  """
+  start = findStartCell(grid)
+  if not start:
+    raise ValueError('no S in grid')
+  (r, c) = (start_r, start_c) = start
+
+  # leave the start cell along the loop, not along a stray pipe
+  start_dirs = startDirections(grid, r, c)
+  if not start_dirs:
+    raise ValueError('no loop through S')
+  d = start_dirs[0]
+
+  # (row step, col step) for each direction
+  steps = {UP: (-1, 0), RIGHT: (0, 1), DOWN: (1, 0), LEFT: (0, -1)}
+
+  length = 0
+  signed_area = 0
+  while True:
+    (dr, dc) = steps[d]
+    signed_area += c * dr
+    r += dr
+    c += dc
+    length += 1
+    if r == start_r and c == start_c: break
+    d = goes[(grid[r][c], invDir(d))]
+
+  area = abs(signed_area)
+  enclosed = area - length // 2 + 1
+  return (length, enclosed)
+
+
+def connects(pipe, d):
+  return pipe in pipes and d in pipes[pipe]
+
+
+def findLoops(grid):
+  """
+  Find every closed loop in the grid in a couple of linear passes,
+  rather than tracing from each possible start point.
+  Returns a list of ((row, col), length, enclosed) tuples, one per loop,
+  where (row, col) is the first cell of the loop in row-major order.
+
+  'S' is first replaced by the pipe that closes the loop through it
+  (see startDirections), so stray pipes pointing at S don't join it.
+
+  Cells whose pipes connect to each other are merged with a disjoint
+  set stored in flat arrays. A component is a loop if every cell in it
+  has exactly two connections.
+
+  The enclosed area is found without knowing the order of the cells.
+  Between the centers of rows r and r+1, the loop crosses at every cell
+  in row r with a downward connection. Taking those crossings in pairs
+  from left to right gives the width of the loop in that strip, and the
+  strips add up to its area. Pick's theorem then gives the cell count.
+  """
+  row_count = len(grid)
+  width = len(grid[0])
+  n = row_count * width
+  parent = list(range(n))
+  size = [1] * n
+  degree = bytearray(n)
+  down = bytearray(n)
+
+  def find(i):
+    while parent[i] != i:
+      parent[i] = parent[parent[i]]
+      i = parent[i]
+    return i
+
+  def union(i, j):
+    degree[i] += 1
+    degree[j] += 1
+    i = find(i)
+    j = find(j)
+    if i == j: return
+    if size[i] < size[j]:
+      (i, j) = (j, i)
+    parent[j] = i
+    size[i] += size[j]
+
+  # the pipe under 'S', or '.' if no loop goes through it
+  start = findStartCell(grid)
+  start_pipe = '.'
+  if start:
+    start_dirs = startDirections(grid, *start)
+    if start_dirs:
+      start_pipe = pipe_inv[start_dirs]
+
+  def pipeAt(r, c):
+    p = grid[r][c]
+    return start_pipe if p == 'S' else p
+
+  # only check right and down, so each connection is seen once
+  for r, row in enumerate(grid):
+    for c, p in enumerate(row):
+      if p == '.': continue
+      if p == 'S': p = start_pipe
+      i = r * width + c
+      if c+1 < width and connects(p, RIGHT) and connects(pipeAt(r, c+1), LEFT):
+        union(i, i+1)
+      if r+1 < row_count and connects(p, DOWN) and connects(pipeAt(r+1, c), UP):
+        union(i, i+width)
+        down[i] = 1
+
+  # root -> [first cell, length, is_loop, area, open crossing column]
+  components = {}
+  for i in range(n):
+    if degree[i] == 0: continue
+    root = find(i)
+    comp = components.get(root)
+    if comp == None:
+      comp = components[root] = [i, 0, True, 0, None]
+    comp[1] += 1
+    if degree[i] != 2:
+      comp[2] = False
+    if down[i]:
+      c = i % width
+      if comp[4] == None:
+        comp[4] = c
+      else:
+        comp[3] += c - comp[4]
+        comp[4] = None
+
+  loops = []
+  for (first, length, is_loop, area, _) in components.values():
+    if not is_loop: continue
+    enclosed = area - length // 2 + 1
+    loops.append((divmod(first, width), length, enclosed))
+  loops.sort()
+  return loops
+
+
+def testFindLoops():
+  cases = [
+    # plain loop
+    ['.....',
+     '.S-7.',
+     '.|.|.',
+     '.L-J.',
+     '.....'],
+    # stray pipe to the left of S pointing at it
+    ['.....',
+     '-S-7.',
+     '.|.|.',
+     '.L-J.',
+     '.....'],
+    # stray pipes on two sides of S, and a second loop elsewhere
+    ['..|....',
+     '-S--7..',
+     '.|..|..',
+     '.L--J..',
+     '...F7..',
+     '...LJ..'],
+    # larger enclosed area, S on a corner with a stray below it
+    ['.F----7.',
+     '.|F--7|.',
+     '.||..||.',
+     '.|L-7||.',
+     '.S--J||.',
+     '||...LJ.'],
+  ]
+  for grid in cases:
+    (length, enclosed) = traceLoop(grid)
+    loops = findLoops(grid)
+    assert (length, enclosed) in [(l[1], l[2]) for l in loops], \
+      f'loop through S ({length}, {enclosed}) missing from {loops}'
+  print('findLoops ok')
+
+
 if __name__ == '__main__':
   filename = 'day10.in.txt'
   if len(sys.argv) > 1:
     filename = sys.argv[1]
+  # testFindLoops()
 
   with open(filename) as inf:
     grid = readGrid(inf)
-  part1(grid)
-  part2(grid)
+  (length, enclosed) = traceLoop(grid)
+  print(f'part1 {length//2}')
+  print(f'part2 {enclosed}')
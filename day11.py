@@ -105,11 +105,54 @@ def part2(grid):
   print(f'part2 {dist_sum}')
 
 
+def axisSums(counts):
+  """
+  counts[x] is the number of galaxies in row (or column) x.
+  Returns (coord_sum, empty_sum): the sum over all pairs of galaxies of
+  the distance between them along this axis, and of the number of empty
+  lines between them.
+
+  Walking the lines in order, each galaxy at x is |x - y| from every
+  earlier galaxy at y, which adds up to (earlier count) * x - (sum of
+  earlier coordinates). The same works for the count of empty lines
+  passed so far.
+  """
+  seen = seen_x = seen_empty = 0
+  coord_sum = empty_sum = 0
+  empty = 0
+  for x, n in enumerate(counts):
+    if n == 0:
+      empty += 1
+      continue
+    coord_sum += n * (seen * x - seen_x)
+    empty_sum += n * (seen * empty - seen_empty)
+    seen += n
+    seen_x += n * x
+    seen_empty += n * empty
+  return (coord_sum, empty_sum)
+
+
+def distanceSums(grid, factors):
+  """
+  Return the sum of distances between all pairs of galaxies for each
+  expansion factor in factors. Each empty line becomes factor lines,
+  so the sum is linear in the factor and one pass covers all of them.
+  """
+  row_counts = [sum(1 for e in row if e == '#') for row in grid]
+  col_counts = [sum(1 for e in col if e == '#') for col in zip(*grid)]
+  (row_coord, row_empty) = axisSums(row_counts)
+  (col_coord, col_empty) = axisSums(col_counts)
+  coord_sum = row_coord + col_coord
+  empty_sum = row_empty + col_empty
+  return [coord_sum + (factor - 1) * empty_sum for factor in factors]
+
+
 if __name__ == '__main__':
   filename = 'day11.in.txt'
   if len(sys.argv) > 1:
     filename = sys.argv[1]
   with open(filename) as inf:
-    grid = readGrid(inf, True)
-  part1(copy.deepcopy(grid))
-  part2(grid)
+    grid = readGrid(inf)
+  (sum1, sum2) = distanceSums(grid, [2, 1000000])
+  print(f'part1 {sum1}')
+  print(f'part2 {sum2}')
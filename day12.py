@@ -8,7 +8,7 @@ Pattern matching, combinatorials, dynamic programming.
 Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
-import sys
+import sys, os, re, shelve, collections, heapq, concurrent.futures
 
 def readInput(inf):
   # (str, [pattern, ...])
@@ -62,28 +62,105 @@ def countOptionsSlow(string, pattern, pos):
   return c
   
 
-def part1(inputs):
+def canonicalize(string):
+  """
+  Runs of '.' can be collapsed to one, and leading and trailing '.'
+  removed, without changing the number of arrangements.
+  """
+  if not isinstance(string, str):
+    string = ''.join(string)
+  return re.sub(r'\.+', '.', string).strip('.')
+
+
+class CountCache:
+  """
+  Memoize countOptionsDP on canonicalized records, with a bounded LRU in
+  memory and an optional shelve file on disk that persists between runs.
+  """
+  def __init__(self, max_size = 100000, filename = None):
+    self.max_size = max_size
+    self.memo = collections.OrderedDict()
+    self.disk = shelve.open(filename) if filename else None
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+  def lookup(self, string, pattern):
+    """
+    Return the cached count, or None if it needs to be computed.
+    """
+    key = canonicalize(string) + ' ' + ','.join([str(x) for x in pattern])
+    count = self.memo.get(key)
+    if count != None:
+      self.hits += 1
+      self.memo.move_to_end(key)
+      return count
+
+    if self.disk != None and key in self.disk:
+      self.disk_hits += 1
+      count = self.disk[key]
+      self.remember(key, count)
+      return count
+
+    self.misses += 1
+    return None
+
+  def store(self, string, pattern, count):
+    key = canonicalize(string) + ' ' + ','.join([str(x) for x in pattern])
+    if self.disk != None:
+      self.disk[key] = count
+    self.remember(key, count)
+
+  def remember(self, key, count):
+    self.memo[key] = count
+    if len(self.memo) > self.max_size:
+      self.memo.popitem(last=False)
+
+  def count(self, string, pattern):
+    count = self.lookup(string, pattern)
+    if count == None:
+      count = countOptionsDP(canonicalize(string), pattern)
+      self.store(string, pattern, count)
+    return count
+
+  def stats(self):
+    lookups = self.hits + self.disk_hits + self.misses
+    if lookups == 0:
+      return 'cache: no lookups'
+    return (f'cache: {lookups} lookups, {self.hits} memory hits '
+            f'({100. * self.hits / lookups:.1f}%), {self.disk_hits} disk hits '
+            f'({100. * self.disk_hits / lookups:.1f}%), {self.misses} computed')
+
+  def close(self):
+    if self.disk != None:
+      self.disk.close()
+      self.disk = None
+
+
+def part1(inputs, cache = None):
   # inputs = readInput(inf)
   sum = 0
   for string, pattern in inputs:
     # print(f'{"".join(string)} == {pattern}')
     # count = countOptionsSlow(string, pattern, 0)
-    count = countOptionsFast(string, pattern)
+    if cache:
+      count = cache.count(string, pattern)
+    else:
+      count = countOptionsDP(string, pattern)
     # print(f'  {count}')
     sum += count
   print(f'part1 {sum}')
 
 
-def expandString(s):
+def expandString(s, factor = 5):
   s2 = s.copy()
-  for _ in range(4):
+  for _ in range(factor-1):
     s2.append('?')
     s2.extend(s)
   return s2
 
-def expandPattern(p):
-  p2 = p+p
-  return p2+p2+p
+def expandPattern(p, factor = 5):
+  return p * factor
 
 def linearizePattern(p):
   """
@@ -170,8 +247,298 @@ def countOptionsFast(string, pattern):
   count = opt.get(len(pattern), 0)
   return count
         
+
+def countOptionsDP(string, pattern):
+  """
+  Count arrangements with a DP over (position, group index) stored in
+  flat lists, one column per group.
+
+  col[i] is the number of ways to place groups g.. in string[i:].
+  Either string[i] is used as a '.', and the count is col[i+1], or group g
+  starts at i, and the count is the next group's column just past the
+  run and the '.' that must follow it.
+
+  A run of length L can start at i if string[i:i+L] has no '.', which is
+  one subtraction of prefix counts, and string[i+L] is not a '#'.
+  """
+  if not isinstance(string, str):
+    string = ''.join(string)
+  n = len(string)
+
+  # dot_count[i] = number of '.' in string[:i], same for hash_count
+  dot_count = [0] * (n+1)
+  hash_count = [0] * (n+1)
+  for i, c in enumerate(string):
+    dot_count[i+1] = dot_count[i] + (c == '.')
+    hash_count[i+1] = hash_count[i] + (c == '#')
+
+  # last group: every position with no '#' after it has one way to
+  # place no more groups. col[n+1] duplicates col[n] so a run that ends
+  # exactly at the end of the string can look one past it.
+  next_col = [int(hash_count[n] == hash_count[i]) for i in range(n+1)]
+  next_col.append(next_col[n])
+
+  # Group g can only start at i if groups 0..g-1 fit before i and
+  # groups g.. fit after it, so each column only needs that window.
+  group_count = len(pattern)
+  need_before = [0] * (group_count+1)
+  for g in range(group_count):
+    need_before[g+1] = need_before[g] + pattern[g] + 1
+  need_after = 0
+
+  for g in range(group_count-1, -1, -1):
+    length = pattern[g]
+    need_after += length + (1 if g < group_count-1 else 0)
+    col = [0] * (n+2)
+    for i in range(n - need_after, need_before[g] - 1, -1):
+      count = col[i+1] if string[i] != '#' else 0
+      end = i + length
+      if (dot_count[end] == dot_count[i]
+          and (end == n or string[end] != '#')):
+        count += next_col[end+1]
+      col[i] = count
+    col[n+1] = col[n]
+    next_col = col
+
+  return next_col[0]
+
+
+def unitPattern(pattern):
+  """
+  Each group followed by a '.'. Unfolded patterns are this repeated.
+  For example: [1,2,3] -> "#.##.###."
+  """
+  return ''.join(['#'*x + '.' for x in pattern])
+
+
+def blockTransitions(unit, block, start):
+  """
+  Run the matcher from countOptionsFast over block, using an endless
+  repetition of unit as the pattern, starting at position start.
+  Returns a dict of end position -> count.
+  """
+  unit_len = len(unit)
+  opt = {start: 1}
+  for c in block:
+    next_opt = {}
+    for pi, count in opt.items():
+      o = pi % unit_len
+      if unit[o] == '#':
+        if c != '.':
+          addOption(next_opt, pi+1, count)
+        # a '.' is only allowed before a group starts
+        if c != '#' and unit[o-1] == '.':
+          addOption(next_opt, pi, count)
+      else:
+        # the '.' that has to follow a group
+        if c != '#':
+          addOption(next_opt, pi+1, count)
+    opt = next_opt
+  return opt
+
+
+def polyFromTerms(terms):
+  """
+  Build a polynomial from a dict of degree -> coefficient.
+  Polynomials are stored as (low, coefficients), where coefficients[i]
+  is the coefficient of z**(low+i). Skipping the empty low end matters
+  because most entries only have terms in a band of degrees.
+  """
+  low = min(terms)
+  coefs = [0] * (max(terms) - low + 1)
+  for d, c in terms.items():
+    coefs[d - low] += c
+  return (low, coefs)
+
+
+def polyMul(a, b, max_degree):
+  """
+  Multiply two polynomials, dropping terms above max_degree. Returns
+  None if nothing is left. The coefficients are all nonnegative, so long
+  polynomials are packed into one big integer each (Kronecker
+  substitution) and multiplied in a single C-level operation.
+  """
+  (a_low, a) = a
+  (b_low, b) = b
+  low = a_low + b_low
+  n = min(len(a) + len(b) - 1, max_degree + 1 - low)
+  if n <= 0:
+    return None
+  a = a[:n]
+  b = b[:n]
+
+  if min(len(a), len(b)) < 8:
+    result = [0] * n
+    for i, x in enumerate(a):
+      if x == 0: continue
+      for j, y in enumerate(b[:n-i]):
+        result[i+j] += x * y
+    return (low, result)
+
+  # each product coefficient is below 2**bits
+  bits = (max(a).bit_length() + max(b).bit_length()
+          + min(len(a), len(b)).bit_length())
+  size = bits // 8 + 1
+  packed_a = int.from_bytes(b''.join(x.to_bytes(size, 'little') for x in a), 'little')
+  packed_b = int.from_bytes(b''.join(x.to_bytes(size, 'little') for x in b), 'little')
+  prod = (packed_a * packed_b).to_bytes(size * (len(a) + len(b)), 'little')
+  return (low, [int.from_bytes(prod[i*size:(i+1)*size], 'little') for i in range(n)])
+
+
+def polyAdd(a, b):
+  (a_low, a_coefs) = a
+  (b_low, b_coefs) = b
+  low = min(a_low, b_low)
+  result = [0] * (max(a_low + len(a_coefs), b_low + len(b_coefs)) - low)
+  for i, c in enumerate(a_coefs):
+    result[a_low - low + i] += c
+  for i, c in enumerate(b_coefs):
+    result[b_low - low + i] += c
+  return (low, result)
+
+
+def blockOperator(unit, block, starts):
+  """
+  The transfer operator for one block of the unfolded string, as a dict
+  start state -> {end state: polynomial}. A state is a position in unit,
+  and the coefficient of z**d counts the ways to cross the block while
+  advancing d full copies of unit.
+  """
+  unit_len = len(unit)
+  op = {}
+  for start in starts:
+    terms = {}
+    for pi, count in blockTransitions(unit, block, start).items():
+      (d, o) = divmod(pi, unit_len)
+      o_terms = terms.setdefault(o, {})
+      o_terms[d] = o_terms.get(d, 0) + count
+    if terms:
+      op[start] = {o: polyFromTerms(t) for o, t in terms.items()}
+  return op
+
+
+def composeOperators(a, b, max_degree):
+  """
+  The operator for crossing a block with operator a, then one with b.
+  """
+  result = {}
+  for start, a_row in a.items():
+    row = {}
+    for mid, a_poly in a_row.items():
+      for end, b_poly in b.get(mid, {}).items():
+        prod = polyMul(a_poly, b_poly, max_degree)
+        if prod == None: continue
+        row[end] = polyAdd(row[end], prod) if end in row else prod
+    if row:
+      result[start] = row
+  return result
+
+
+def countOptionsUnfolded(string, pattern, factor):
+  """
+  Count arrangements of string unfolded factor times (joined by '?')
+  against pattern repeated factor times, without building either.
+
+  The unfolded string is cut into a prefix, factor-1 identical middle
+  blocks, and a suffix. If string has a '.', the cuts go right after
+  the first one, where the matcher can only be at the start of a group,
+  which keeps the number of boundary states down to the number of
+  groups. The middle block's transfer operator is raised to the
+  (factor-1) power by repeated squaring.
+
+  The number of pattern copies used so far is not bounded, so operator
+  entries are polynomials in the number of copies, truncated at factor.
+  The counts themselves grow to thousands of bits, and the big integer
+  multiplies end up dominating the run time.
+  """
+  if not isinstance(string, str):
+    string = ''.join(string)
+  unit = unitPattern(pattern)
+  unit_len = len(unit)
+
+  cut = string.find('.') + 1
+  prefix = string[:cut]
+  middle = string[cut:] + '?' + string[:cut]
+  suffix = string[cut:]
+
+  if cut:
+    # right after a '.' the matcher is always at the start of a group
+    starts = [o for o in range(unit_len) if unit[o] == '#' and unit[o-1] == '.']
+  else:
+    starts = range(unit_len)
+
+  # the prefix is an operator with a single start state
+  vec = blockOperator(unit, prefix, [0])
+  power = blockOperator(unit, middle, starts)
+  e = factor - 1
+  while e:
+    if e & 1:
+      vec = composeOperators(vec, power, factor)
+    e >>= 1
+    if e:
+      power = composeOperators(power, power, factor)
+
+  # the whole pattern must be used, with or without its final '.'
+  total = 0
+  targets = (factor * unit_len, factor * unit_len - 1)
+  for o, (low, coefs) in vec.get(0, {}).items():
+    for pi, count in blockTransitions(unit, suffix, o).items():
+      for i, coef in enumerate(coefs):
+        if coef and (low + i) * unit_len + pi in targets:
+          total += coef * count
+  return total
+
           
-def part2(inputs):
+def countShard(shard):
+  """
+  Worker for countParallel. shard is a list of (string, pattern) tuples.
+  """
+  return [countOptionsDP(string, pattern) for string, pattern in shard]
+
+
+def makeShards(jobs, shard_count):
+  """
+  Split jobs into shard_count lists of similar total cost, estimating
+  the cost of each as string length times group count. Each job goes to
+  the least loaded shard, biggest first. Returns a list of lists of
+  indices into jobs.
+  """
+  order = sorted(range(len(jobs)),
+                 key = lambda i: len(jobs[i][0]) * len(jobs[i][1]),
+                 reverse = True)
+  shards = [[] for _ in range(shard_count)]
+  # (total cost, shard index)
+  loads = [(0, i) for i in range(shard_count)]
+  for i in order:
+    (load, si) = heapq.heappop(loads)
+    shards[si].append(i)
+    heapq.heappush(loads, (load + len(jobs[i][0]) * len(jobs[i][1]), si))
+  return [shard for shard in shards if shard]
+
+
+def countParallel(jobs, workers):
+  """
+  Count the options for each (string, pattern) in jobs using a pool of
+  worker processes. Strings and patterns are sent as str and tuple,
+  which pickle much smaller than lists. Returns the counts in the same
+  order as jobs.
+  """
+  jobs = [(canonicalize(string), tuple(pattern)) for string, pattern in jobs]
+  shards = makeShards(jobs, workers)
+  counts = [0] * len(jobs)
+  with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+    results = pool.map(countShard, [[jobs[i] for i in shard] for shard in shards])
+    for shard, shard_counts in zip(shards, results):
+      for i, count in zip(shard, shard_counts):
+        counts[i] = count
+  return counts
+
+
+# below this many records, starting a process pool isn't worth it
+PARALLEL_MIN_JOBS = 200
+
+
+def part2(inputs, cache = None, workers = 1):
   #  .??..??...?##.?.??..??...?##.?.??..??...?##.?.??..??...?##.?.??..??...?##.
   # [1, 1, 3, 1, 1, 3, 1, 1, 3, 1, 1, 3, 1, 1, 3]
   """
@@ -215,12 +582,31 @@ def part2(inputs):
    .
   
   """
+  if workers > 1 and len(inputs) >= PARALLEL_MIN_JOBS:
+    jobs = [(expandString(string), expandPattern(pattern))
+            for string, pattern in inputs]
+    counts = [cache.lookup(*job) if cache else None for job in jobs]
+    todo = [i for i, count in enumerate(counts) if count == None]
+    for i, count in zip(todo, countParallel([jobs[i] for i in todo], workers)):
+      counts[i] = count
+      if cache:
+        cache.store(*jobs[i], count)
+    # can't call sum(), it's a local variable in this function
+    total = 0
+    for count in counts:
+      total += count
+    print(f'part2 {total}')
+    return
+
   sum = 0
   for string, pattern in inputs:
 
     string = expandString(string)
     pattern = expandPattern(pattern)
-    count = countOptionsFast(string, pattern)
+    if cache:
+      count = cache.count(string, pattern)
+    else:
+      count = countOptionsDP(string, pattern)
     # print(f'  {count}\n')
     sum += count
   print(f'part2 {sum}')
@@ -230,7 +616,12 @@ if __name__ == '__main__':
   filename = 'day12.in.txt'
   if len(sys.argv) > 1:
     filename = sys.argv[1]
+  # optional second argument: file in which to keep counts between runs
+  cache_filename = sys.argv[2] if len(sys.argv) > 2 else None
   with open(filename) as inf:
     inputs = readInput(inf)
-  part1(inputs)
-  part2(inputs)
+  cache = CountCache(filename = cache_filename)
+  part1(inputs, cache)
+  part2(inputs, cache, os.cpu_count() or 1)
+  print(cache.stats())
+  cache.close()
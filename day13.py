@@ -10,6 +10,12 @@ Ed Karrels, ed.karrels@gmail.com, December 2023
 
 import sys
 
+# numpy is optional; without it signatures are computed one cell at a time
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
 def readGrids(inf):
   grid = []
   while True:
@@ -71,6 +77,50 @@ def rowBits(grid, r):
 def rowBitses(grid):
   return [rowBits(grid, r) for r in range(len(grid))]
 
+def bitMatrixToInts(bits):
+  """
+  bits is a 2-d boolean array. Returns each row as an integer, with the
+  first column as the most significant bit, like rowBits().
+  """
+  width = bits.shape[1]
+  if width <= 63:
+    weights = np.left_shift(np.int64(1), np.arange(width-1, -1, -1, dtype=np.int64))
+    return (bits.astype(np.int64) @ weights).tolist()
+
+  # too wide for int64: pack into bytes and let Python ints take over
+  packed = np.packbits(bits, axis=1)
+  pad = packed.shape[1] * 8 - width
+  return [int.from_bytes(row.tobytes(), 'big') >> pad for row in packed]
+
+
+def signatures(grids):
+  """
+  Returns a list of (row_bits, col_bits) for each grid, the same values
+  as rowBitses() and colBitses(). Grids with the same shape are stacked
+  into one array so each group is handled with a couple of array
+  operations.
+  """
+  if np == None:
+    return [(rowBitses(grid), colBitses(grid)) for grid in grids]
+
+  by_shape = {}
+  for i, grid in enumerate(grids):
+    by_shape.setdefault((len(grid), len(grid[0])), []).append(i)
+
+  result = [None] * len(grids)
+  for (height, width), indices in by_shape.items():
+    text = ''.join([''.join(grids[i]) for i in indices]).encode()
+    cells = np.frombuffer(text, dtype=np.uint8).reshape(len(indices), height, width)
+    cells = cells == ord('#')
+    row_bits = bitMatrixToInts(cells.reshape(-1, width))
+    # columns: transpose each grid so columns become rows
+    col_bits = bitMatrixToInts(cells.transpose(0, 2, 1).reshape(-1, height))
+    for k, i in enumerate(indices):
+      result[i] = (row_bits[k*height:(k+1)*height],
+                   col_bits[k*width:(k+1)*width])
+  return result
+
+
 def isReflection(a, m):
   # returns True if a[0:m] == a[m:] reversed
   # 0 1 2 3 4 5
@@ -121,32 +171,117 @@ def findAlmostReflection(a):
   return None
 
 
+class MirrorFinder:
+  """
+  Find reflections in a sequence of row or column signatures with up to
+  k smudges, in roughly O(n * (k+1) * log n) rather than O(n**2).
+
+  Prefix hashes of the sequence and of its reverse answer "how far do
+  these two runs match, one going forward and one going backward?" with
+  a binary search. From each mirror position, jump to the next
+  mismatched pair, charge its popcount against the budget, and continue
+  past it. Each jump costs at least one bit, so there are at most k+1
+  of them per position.
+  """
+  MOD = (1 << 61) - 1
+  BASE = 1000003
+
+  def __init__(self, a):
+    self.a = a
+    n = self.n = len(a)
+    # map signatures (which may be big ints) to small ids before hashing
+    ids = {}
+    seq = [ids.setdefault(x, len(ids) + 1) for x in a]
+    self.power = [1] * (n+1)
+    self.fwd = [0] * (n+1)
+    self.rev = [0] * (n+1)
+    for i in range(n):
+      self.power[i+1] = self.power[i] * self.BASE % self.MOD
+      self.fwd[i+1] = (self.fwd[i] * self.BASE + seq[i]) % self.MOD
+      self.rev[i+1] = (self.rev[i] * self.BASE + seq[n-1-i]) % self.MOD
+
+  def hashFwd(self, start, length):
+    return (self.fwd[start+length] - self.fwd[start] * self.power[length]) % self.MOD
+
+  def hashRev(self, start, length):
+    return (self.rev[start+length] - self.rev[start] * self.power[length]) % self.MOD
+
+  def matchLength(self, lo, hi):
+    """
+    Largest L such that a[hi+i] == a[lo-i] for all i < L.
+    """
+    # a[lo-i] is the reversed sequence at n-1-lo+i
+    rev_start = self.n - 1 - lo
+    low = 0
+    high = min(lo + 1, self.n - hi)
+    while low < high:
+      mid = (low + high + 1) // 2
+      if self.hashFwd(hi, mid) == self.hashRev(rev_start, mid):
+        low = mid
+      else:
+        high = mid - 1
+    return low
+
+  def smudges(self, m, k):
+    """
+    Number of bits that differ across the mirror between m-1 and m,
+    or None if that is more than k.
+    """
+    lo = m - 1
+    hi = m
+    total = 0
+    while lo >= 0 and hi < self.n:
+      skip = self.matchLength(lo, hi)
+      lo -= skip
+      hi += skip
+      if lo < 0 or hi >= self.n:
+        break
+      total += bin(self.a[lo] ^ self.a[hi]).count('1')
+      if total > k:
+        return None
+      lo -= 1
+      hi += 1
+    return total
+
+  def find(self, k = 0):
+    """
+    Return the first mirror position with exactly k smudges, or None.
+    """
+    for m in range(1, self.n):
+      if self.smudges(m, k) == k:
+        return m
+    return None
+
+
+def findReflectionK(a, k = 0):
+  return MirrorFinder(a).find(k)
+
+
 def part1(filename):
   with open(filename) as inf:
-    sum = 0
-    for grid in readGrids(inf):
-      # printGrid(grid)
-      # rh = rowHashes(grid)
-      rh = rowBitses(grid)
-      m = findReflection(rh)
-      if m != None:
-        # print(f'{m} rows')
-        sum += 100 * m
-        continue
-
-      # ch = colHashes(grid)
-      ch = colBitses(grid)
-      m = findReflection(ch)
-      if m != None:
-        # print(f'{m} cols')
-        sum += m
-        continue
-
-      print('Noone!')
-
-      # print(repr(ch))
-      # print(repr(rh))
-      # print()
+    grids = list(readGrids(inf))
+  sum = 0
+  for rh, ch in signatures(grids):
+    # printGrid(grid)
+    # rh = rowHashes(grid)
+    m = findReflectionK(rh)
+    if m != None:
+      # print(f'{m} rows')
+      sum += 100 * m
+      continue
+
+    # ch = colHashes(grid)
+    m = findReflectionK(ch)
+    if m != None:
+      # print(f'{m} cols')
+      sum += m
+      continue
+
+    print('Noone!')
+
+    # print(repr(ch))
+    # print(repr(rh))
+    # print()
 
   print(f'part1 {sum}')
   # 37561
@@ -154,34 +289,33 @@ def part1(filename):
 
 def part2(filename):
   with open(filename) as inf:
-    sum = 0
-    for grid in readGrids(inf):
-      # printGrid(grid)
-      # print()
-      row_bits = rowBitses(grid)
-      # for r1 in range(len(row_bits)):
-      #   for r2 in range(r1+1, len(row_bits)):
-      #     if isSimilar(row_bits[r1], row_bits[r2]):
-      #       print(f'  similar rows {r1}, {r2}')
-
-      m = findAlmostReflection(row_bits)
-      if m != None:
-        # print(f'{m} rows')
-        sum += 100 * m
-        continue
-
-      col_bits = colBitses(grid)
-      # for c1 in range(len(col_bits)):
-      #   for c2 in range(c1+1, len(col_bits)):
-      #     if isSimilar(col_bits[c1], col_bits[c2]):
-      #       print(f'  similar cols {c1}, {c2}')
-
-      m = findAlmostReflection(col_bits)
-      if m != None:
-        # print(f'{m} cols')
-        sum += m
-        # continue
-          
+    grids = list(readGrids(inf))
+  sum = 0
+  for row_bits, col_bits in signatures(grids):
+    # printGrid(grid)
+    # print()
+    # for r1 in range(len(row_bits)):
+    #   for r2 in range(r1+1, len(row_bits)):
+    #     if isSimilar(row_bits[r1], row_bits[r2]):
+    #       print(f'  similar rows {r1}, {r2}')
+
+    m = findReflectionK(row_bits, 1)
+    if m != None:
+      # print(f'{m} rows')
+      sum += 100 * m
+      continue
+
+    # for c1 in range(len(col_bits)):
+    #   for c2 in range(c1+1, len(col_bits)):
+    #     if isSimilar(col_bits[c1], col_bits[c2]):
+    #       print(f'  similar cols {c1}, {c2}')
+
+    m = findReflectionK(col_bits, 1)
+    if m != None:
+      # print(f'{m} cols')
+      sum += m
+      # continue
+        
   print(f'part2 {sum}')
 
 
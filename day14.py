@@ -8,16 +8,15 @@ Movable items in grid, find cycle.
 Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
-import sys, copy, time
-from common import readGrid, printGrid, gridToString
+import sys, copy, time, random
+from common import readGrid, printGrid, gridToString, findCycle
 
+# numpy is optional; it's only needed for part2numpy and benchmarkNumpy
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
-# enable this to use part2numpy
-# In my experiments numpy ended up being around 30x slower,
-# perhaps because each time an element is accessed it needs to create a python
-# object to encapsulate the value.
-
-# import numpy as np
 EMPTY = 0
 ROCK = 1
 WALL = 255
@@ -43,7 +42,7 @@ def compileRuns(row, wall = '#'):
       if start == None:
         start = i
   if start != None:
-    runs.append((start, len(grid)-1))
+    runs.append((start, len(row)-1))
   return runs
   
 
@@ -178,9 +177,57 @@ def rollWestFast(grid, row_runs, rock = 'O', empty = '.'):
   for row, row_runs in zip(grid, row_runs):
     rollRowWestFast(row, row_runs, rock, empty)
   
-          
-def rollWestNumpy(grid, row_runs):
-  rollWestFast(grid, row_runs, ROCK, EMPTY)
+
+def segmentTables(grid):
+  """
+  Precompute what a vectorized tilt of a 2-d numpy grid along its rows
+  needs. Every row is cut into segments at the walls, and each wall is a
+  segment of its own. Cells are numbered in row-major order of the grid
+  as given, so for a transposed view the segments run down the columns.
+
+  Returns (starts, seg_id, offset, rev_offset, background):
+    starts: flat index of the first cell of each segment
+    seg_id: segment number of each cell
+    offset, rev_offset: distance of each cell from the start and end
+      of its segment
+    background: the grid with every rock removed
+  """
+  height, width = grid.shape
+  walls = (grid == WALL).ravel()
+  index = np.arange(height * width)
+  # a segment starts at each row start, at each wall, and after each wall
+  is_start = index % width == 0
+  is_start |= walls
+  is_start[1:] |= walls[:-1]
+  starts = np.flatnonzero(is_start)
+  seg_id = np.cumsum(is_start) - 1
+  ends = np.append(starts[1:], height * width)
+  offset = index - starts[seg_id]
+  rev_offset = ends[seg_id] - 1 - index
+  background = np.where(grid == WALL, WALL, EMPTY).astype(grid.dtype)
+  return (starts, seg_id, offset, rev_offset, background)
+
+
+def tiltNumpy(grid, tables, toward_end = False):
+  """
+  Roll every rock along the rows of grid, toward the start of each row
+  or toward the end of it. grid may be a transposed view, in which case
+  the writes go through to the underlying array.
+
+  np.add.reduceat counts the rocks in each segment, and a cell ends up
+  holding a rock if its distance from the near end of the segment is
+  less than that count.
+  """
+  (starts, seg_id, offset, rev_offset, background) = tables
+  rocks = (grid == ROCK).ravel()
+  counts = np.add.reduceat(rocks, starts, dtype=np.int32)
+  position = rev_offset if toward_end else offset
+  rocks = (position < counts[seg_id]).reshape(grid.shape)
+  grid[...] = np.where(rocks, ROCK, background)
+
+
+def rollWestNumpy(grid, row_tables):
+  tiltNumpy(grid, row_tables)
 
           
 def rollEast(grid):
@@ -199,8 +246,13 @@ def rollEast(grid):
           some_motion = True
 
           
-def rollRowEastFast(row, row_runs, rock = 'O', empty = '.'):
-  for start, end in row_runs:
+def rollRowEastFast(row, row_runs, rock = 'O', empty = '.', packed = None):
+  """
+  If packed is given (see ZobristHash), returns the hash of the rocks
+  in this row after the tilt and the number of them.
+  """
+  value = rock_count = 0
+  for i, (start, end) in enumerate(row_runs):
     ri = wi = end
 
     # move stones to the start of the run
@@ -210,27 +262,44 @@ def rollRowEastFast(row, row_runs, rock = 'O', empty = '.'):
         wi -= 1
       ri -= 1
 
+    if packed:
+      count = end - wi
+      value ^= packed[i][count]
+      rock_count += count
+
     # empty out the rest of the run
     while wi >= start:
       row[wi] = empty
       wi -= 1
 
+  return (value, rock_count)
 
-def rollEastFast(grid, row_runs, rock = 'O', empty = '.'):
-  for row, row_runs in zip(grid, row_runs):
-    rollRowEastFast(row, row_runs, rock, empty)
+
+def rollEastFast(grid, row_runs, rock = 'O', empty = '.', zobrist = None):
+  if not zobrist:
+    for row, row_runs in zip(grid, row_runs):
+      rollRowEastFast(row, row_runs, rock, empty)
+    return
+
+  zobrist.value = zobrist.load = 0
+  moment = len(grid)
+  for row, row_runs, packed in zip(grid, row_runs, zobrist.packed):
+    (value, rock_count) = rollRowEastFast(row, row_runs, rock, empty, packed)
+    zobrist.value ^= value
+    zobrist.load += moment * rock_count
+    moment -= 1
   
           
-def rollEastNumpy(grid, row_runs):
-  rollEastFast(grid, row_runs, ROCK, EMPTY)
+def rollEastNumpy(grid, row_tables):
+  tiltNumpy(grid, row_tables, True)
 
 
-def rollNorthNumpy(grid_t, col_runs):
-  rollWestNumpy(grid_t, col_runs)
+def rollNorthNumpy(grid_t, col_tables):
+  rollWestNumpy(grid_t, col_tables)
 
 
-def rollSouthNumpy(grid_t, col_runs):
-  rollEastNumpy(grid_t, col_runs)
+def rollSouthNumpy(grid_t, col_tables):
+  rollEastNumpy(grid_t, col_tables)
 
 
 def spin(grid, count):
@@ -241,22 +310,112 @@ def spin(grid, count):
     rollEast(grid)
 
 
-def spinFast(grid, count, row_runs, column_runs):
+def spinFast(grid, count, row_runs, column_runs, zobrist = None):
   for _ in range(count):
     rollNorthFast(grid, column_runs)
     rollWestFast(grid, row_runs)
     rollSouthFast(grid, column_runs)
-    rollEastFast(grid, row_runs)
+    rollEastFast(grid, row_runs, zobrist = zobrist)
 
 
-def spinNumpy(grid, grid_t, count, row_runs, column_runs):
+def spinNumpy(grid, grid_t, count, row_tables, column_tables):
   for _ in range(count):
-    rollNorthNumpy(grid_t, column_runs)
-    rollWestNumpy(grid, row_runs)
-    rollSouthNumpy(grid_t, column_runs)
-    rollEastNumpy(grid, row_runs)
+    rollNorthNumpy(grid_t, column_tables)
+    rollWestNumpy(grid, row_tables)
+    rollSouthNumpy(grid_t, column_tables)
+    rollEastNumpy(grid, row_tables)
     
 
+class Bitboard:
+  """
+  The grid as two big integers, one bit per cell: rocks for the round
+  rocks and walls for the '#' cells. Row r starts at bit r*stride, and
+  stride is width+1 so every row ends with an unused guard bit. The
+  guard bit is never empty, which stops rocks rolling east or west from
+  wrapping onto the next row.
+
+  A tilt moves every rock that has an empty cell next to it one step,
+  all at once with a shift, an and, and an xor, and repeats until
+  nothing moves. Each pass costs a few operations on integers of
+  height*stride bits, rather than a Python loop over the cells.
+  """
+  def __init__(self, grid):
+    self.height = len(grid)
+    self.width = len(grid[0])
+    self.stride = self.width + 1
+    self.rocks = 0
+    self.walls = 0
+    row_mask = (1 << self.width) - 1
+    self.field = 0
+    for r, row in enumerate(grid):
+      shift = r * self.stride
+      self.field |= row_mask << shift
+      for c, cell in enumerate(row):
+        if cell == 'O':
+          self.rocks |= 1 << (shift + c)
+        elif cell == '#':
+          self.walls |= 1 << (shift + c)
+    self.open = self.field & ~self.walls
+
+  def roll(self, shift, toward_low):
+    rocks = self.rocks
+    empty = self.open & ~rocks
+    while True:
+      if toward_low:
+        moving = rocks & (empty << shift)
+        moved = moving >> shift
+      else:
+        moving = rocks & (empty >> shift)
+        moved = moving << shift
+      if not moving: break
+      rocks ^= moving | moved
+      empty ^= moving | moved
+    self.rocks = rocks
+
+  def rollNorth(self):
+    self.roll(self.stride, True)
+
+  def rollSouth(self):
+    self.roll(self.stride, False)
+
+  def rollWest(self):
+    self.roll(1, True)
+
+  def rollEast(self):
+    self.roll(1, False)
+
+  def spin(self, count = 1):
+    for _ in range(count):
+      self.rollNorth()
+      self.rollWest()
+      self.rollSouth()
+      self.rollEast()
+
+  def northLoad(self):
+    load = 0
+    row_mask = (1 << self.width) - 1
+    rocks = self.rocks
+    for moment in range(self.height, 0, -1):
+      load += moment * bin(rocks & row_mask).count('1')
+      rocks >>= self.stride
+    return load
+
+  def toGrid(self):
+    grid = []
+    for r in range(self.height):
+      row = []
+      for c in range(self.width):
+        bit = 1 << (r * self.stride + c)
+        if self.rocks & bit:
+          row.append('O')
+        elif self.walls & bit:
+          row.append('#')
+        else:
+          row.append('.')
+      grid.append(row)
+    return grid
+
+
 def roundRockCount(row):
   i = 0
   for r in row:
@@ -279,57 +438,158 @@ def northLoad(grid):
   return load
 
 
+class ZobristHash:
+  """
+  A hash of the positions of the round rocks that doesn't need the
+  grid to be joined into a string and hashed after every spin.
+
+  Every cell gets a random 64-bit key, and the hash is the xor of the
+  keys of the cells holding rocks. A spin ends with an east tilt, after
+  which every run of open cells in a row holds its rocks packed against
+  its east end. The contribution of a run then depends only on how many
+  rocks it holds, so packed[r][i][k] is precomputed as the xor of the
+  last k keys of run i in row r. rollEastFast() rebuilds the hash and
+  the north load from those counts as it goes, with O(1) work per run.
+  """
+  def __init__(self, grid, row_runs, seed = 14):
+    rng = random.Random(seed)
+    self.keys = [[rng.getrandbits(64) for _ in row] for row in grid]
+    self.packed = []
+    for keys, runs in zip(self.keys, row_runs):
+      row_packed = []
+      for start, end in runs:
+        run_packed = [0]
+        for c in range(end, start-1, -1):
+          run_packed.append(run_packed[-1] ^ keys[c])
+        row_packed.append(run_packed)
+      self.packed.append(row_packed)
+
+    self.value = 0
+    for r, row in enumerate(grid):
+      for c, cell in enumerate(row):
+        if cell == 'O':
+          self.value ^= self.keys[r][c]
+    self.load = northLoad(grid)
+
+
+class SpinArchive:
+  """
+  The north load after every spin up to the point where the states
+  start to repeat. loads[i] is the load after i spins. From spin mu on,
+  the states repeat every cycle_length spins, so the load after any
+  number of spins can be looked up without spinning any further.
+  """
+  def __init__(self, loads, mu, cycle_length):
+    self.loads = loads
+    self.mu = mu
+    self.cycle_length = cycle_length
+
+  def loadAt(self, spin_count):
+    if spin_count >= len(self.loads):
+      spin_count = self.mu + (spin_count - self.mu) % self.cycle_length
+    return self.loads[spin_count]
+
+  def loadsAt(self, spin_counts):
+    return [self.loadAt(n) for n in spin_counts]
+
+
 def part1(grid):
   rollNorth(grid)
   print(f'part1 {northLoad(grid)}')
 
 
-def part2(grid):
+def spinArchive(grid, max_spins = 10000):
+  """
+  Spin the grid until a state repeats, using ZobristHash to identify
+  the states. Returns a SpinArchive, or None if no cycle is found
+  within max_spins.
+  """
   row_runs = rowRuns(grid)
   column_runs = columnRuns(grid)
-  
-  goal_count = 10**9
+  zobrist = ZobristHash(grid, row_runs)
 
-  success = False
-  cycle_length = None
-  spin_count = 0
-  hashes = {}
-  # print(f'spins={spin_count}, north load = {northLoad(grid)}, hash={hashGrid(grid)}')
+  # hash -> spin count when it was first seen
+  hashes = {zobrist.value: 0}
+  loads = [zobrist.load]
   # printGrid(grid)
-  while spin_count <= 10000:
+  for spin_count in range(1, max_spins+1):
     # spin(grid, 1);
-    spinFast(grid, 1, row_runs, column_runs);
-    grid_hash = hashGrid(grid)
-    spin_count += 1
-    # print(f'spins={spin_count}, north load = {northLoad(grid)}, hash={grid_hash}')
-    sys.stdout.write(f'\rspin {spin_count}')
-    if grid_hash in hashes:
-      print(f'\nCycle found at spin counts {hashes[grid_hash]}, {spin_count}')
-      cycle_length = spin_count - hashes[grid_hash]
-      success = True
-      break
-    hashes[grid_hash] = spin_count
-    
-  if not success:
+    spinFast(grid, 1, row_runs, column_runs, zobrist)
+    # print(f'spins={spin_count}, north load = {zobrist.load}, hash={zobrist.value}')
+    if zobrist.value in hashes:
+      mu = hashes[zobrist.value]
+      return SpinArchive(loads, mu, spin_count - mu)
+    hashes[zobrist.value] = spin_count
+    loads.append(zobrist.load)
+
+  return None
+
+
+def part2(grid, goal_counts = (10**9,)):
+  archive = spinArchive(grid)
+  if not archive:
     print('No cycle found.')
     return 1
-    
-  # printGrid(grid)
-  # print(f'North load = {northLoad(grid)}')
+  print(f'Cycle found at spin counts {archive.mu}, {archive.mu + archive.cycle_length}')
 
-  assert cycle_length != None
+  for load in archive.loadsAt(goal_counts):
+    print(f'part2 {load}')
 
-  # say the cycle length is 10 and we're at spin_count 13.
-  # it'll take 7 more spins until we match what we'll be at 100
 
-  additional_spins = (goal_count - spin_count) % cycle_length
-  # spin(grid, additional_spins)
-  spinFast(grid, additional_spins, row_runs, column_runs)
-  
-  spin_count += additional_spins
+def part2bits(grid, goal_counts = (10**9,)):
+  """
+  part2 on a Bitboard. The rocks integer is the whole state, so it is
+  used directly as the key when looking for a cycle.
+  """
+  board = Bitboard(grid)
+
+  spin_count = 0
+  seen = {}
+  loads = []
+  while board.rocks not in seen:
+    seen[board.rocks] = spin_count
+    loads.append(board.northLoad())
+    board.spin()
+    spin_count += 1
+  mu = seen[board.rocks]
+  archive = SpinArchive(loads, mu, spin_count - mu)
+
+  for load in archive.loadsAt(goal_counts):
+    print(f'part2 {load}')
 
-  # print(f'North load at {spin_count} and {goal_count} = {northLoad(grid)}, hash={hashGrid(grid)}')
-  print(f'part2 {northLoad(grid)}')
+
+def part2brent(grid, goal_counts = (10**9,)):
+  """
+  part2 on a Bitboard, with Brent's algorithm (common.findCycle) in
+  place of a dict of every state seen. Only a couple of boards are in
+  memory at once, which matters on huge boards with long pre-periods.
+  """
+  def spinOnce(board):
+    board.spin()
+    return board
+
+  (mu, cycle_length) = findCycle(lambda: Bitboard(grid), spinOnce,
+                                 lambda board: board.rocks)
+  print(f'Cycle found at spin counts {mu}, {mu + cycle_length}')
+
+  # fold each goal into the first pass through the cycle, then spin a
+  # fresh board up to each of them in order
+  targets = []
+  for goal in goal_counts:
+    if goal > mu:
+      goal = mu + (goal - mu) % cycle_length
+    targets.append(goal)
+
+  board = Bitboard(grid)
+  spin_count = 0
+  loads = {}
+  for target in sorted(set(targets)):
+    board.spin(target - spin_count)
+    spin_count = target
+    loads[target] = board.northLoad()
+
+  for target in targets:
+    print(f'part2 {loads[target]}')
 
 
 def numpyRowToString(row):
@@ -345,48 +605,83 @@ def numpyGridToString(grid):
   return '\n'.join([numpyRowToString(row) for row in grid])
 
 
-def part2numpy(grid_orig):
+def gridToNumpy(grid_orig):
   height = len(grid_orig)
   width = len(grid_orig[0])
-  grid = np.zeros((height, width)).astype(np.intc)
-  char_to_int = {'.': 0, '#': WALL, 'O': 1}
-  for r, row in enumerate(grid_orig):
-    for c, cell in enumerate(row):
-      grid[r][c] = char_to_int[cell]
+  text = ''.join([''.join(row) for row in grid_orig]).encode()
+  chars = np.frombuffer(text, dtype=np.uint8).reshape(height, width)
+  grid = np.full((height, width), EMPTY, dtype=np.uint8)
+  grid[chars == ord('O')] = ROCK
+  grid[chars == ord('#')] = WALL
+  return grid
+
+
+def northLoadNumpy(grid):
+  height = grid.shape[0]
+  rocks_per_row = np.count_nonzero(grid == ROCK, axis=1)
+  return int(rocks_per_row @ np.arange(height, 0, -1))
 
-  # this makes a view of the grid, not a copy
+
+def part2numpy(grid_orig):
+  grid = gridToNumpy(grid_orig)
+  # this makes a view of the grid, not a copy, so north/south tilts
+  # on it write straight into grid
   grid_t = grid.transpose()
-  # grid_mirror_row = numpy.flip(grid, 1)
-  # grid_mirror_col = numpy.flip(grid, 0)
+  row_tables = segmentTables(grid)
+  column_tables = segmentTables(grid_t)
 
-  # printNumpyGrid(grid)
+  goal_count = 10**9
+  spin_count = 0
+  hashes = {}
+  while spin_count <= 10000:
+    spinNumpy(grid, grid_t, 1, row_tables, column_tables)
+    grid_hash = hashNumpyGrid(grid)
+    spin_count += 1
+    if grid_hash in hashes:
+      cycle_length = spin_count - hashes[grid_hash]
+      break
+    hashes[grid_hash] = spin_count
+  else:
+    print('No cycle found.')
+    return 1
 
-  row_runs = rowRunsNumpy(grid)
-  column_runs = rowRunsNumpy(grid_t)
+  additional_spins = (goal_count - spin_count) % cycle_length
+  spinNumpy(grid, grid_t, additional_spins, row_tables, column_tables)
+  print(f'part2 {northLoadNumpy(grid)}')
+
+
+def benchmarkNumpy(grid_orig, spin_count = 100):
+  """
+  Time spinFast against spinNumpy on the same grid, and check that
+  they end up with the same result.
+  """
+  grid_orig = copy.deepcopy(grid_orig)
+  row_runs = rowRuns(grid_orig)
+  column_runs = columnRuns(grid_orig)
+
+  grid = gridToNumpy(grid_orig)
+  grid_t = grid.transpose()
+  timer_tables = time.time()
+  row_tables = segmentTables(grid)
+  column_tables = segmentTables(grid_t)
+  timer_tables = time.time() - timer_tables
 
-  spin_count = 10
-  
-  print('orig')
-  # rollSouth(grid_orig)
-  # rollSouthFast(grid_orig, column_runs)
-  # spin(grid_orig, 10)
   timer_old = time.time()
   spinFast(grid_orig, spin_count, row_runs, column_runs)
   timer_old = time.time() - timer_old
-  orig_str = gridToString(grid_orig)
-  print(orig_str)
 
-  print('\nnumpy')
   timer_numpy = time.time()
-  spinNumpy(grid, grid_t, spin_count, row_runs, column_runs)
+  spinNumpy(grid, grid_t, spin_count, row_tables, column_tables)
   timer_numpy = time.time() - timer_numpy
-  # rollSouthNumpy(grid_t, column_runs)
-  numpy_str = numpyGridToString(grid)
-  print(numpy_str)
-  if orig_str != numpy_str:
-    print("ERROR mismatch")
 
-  print(f'orig {timer_old}, numpy {timer_numpy}')
+  ok = gridToString(grid_orig) == numpyGridToString(grid)
+  print(f'{len(grid_orig)}x{len(grid_orig[0])} grid, {spin_count} spins')
+  print(f'  orig  {timer_old:.3f}s')
+  print(f'  numpy {timer_numpy:.3f}s (+{timer_tables:.3f}s setup), '
+        f'{timer_old / max(timer_numpy, 1e-9):.1f}x')
+  if not ok:
+    print('  ERROR mismatch')
+  return ok
 
 
 if __name__ == '__main__':
@@ -395,5 +690,8 @@ if __name__ == '__main__':
     filename = sys.argv[1]
   grid = readGrid(filename, True)
   part1(copy.deepcopy(grid))
-  part2(copy.deepcopy(grid))
-  # part2numpy(grid)
+  part2bits(grid)
+  # part2(copy.deepcopy(grid))
+  # part2brent(grid)
+  # part2numpy(copy.deepcopy(grid))
+  # benchmarkNumpy(grid)
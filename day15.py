@@ -8,7 +8,13 @@ Implement a hash table
 Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
-import sys, re
+import sys, os, re, mmap
+
+# numpy is optional; without it hashSum() runs one byte at a time
+try:
+  import numpy as np
+except ImportError:
+  np = None
 
 """
 Determine the ASCII code for the current character of the string.
@@ -25,14 +31,108 @@ def hashString(s):
   return state
 
 
+# HASH_TABLE[state * 256 + byte] is the state after HASHing byte
+HASH_TABLE = bytes([((state + b) * 17) & 255
+                    for state in range(256) for b in range(256)])
+
+# tokens end at commas, and also at line breaks like part1 with split()
+SEPARATORS = b',\r\n'
+
+
+def hashSumBytes(buf):
+  """
+  Sum of the HASH of each comma-separated token in buf, which can be
+  any bytes-like object, including an mmap. Each byte is a single lookup in HASH_TABLE,
+  and no strings are created for the tokens.
+  """
+  table = HASH_TABLE
+  separators = set(SEPARATORS)
+  total = state = 0
+  for b in memoryview(buf).cast('B'):
+    if b in separators:
+      total += state
+      state = 0
+    else:
+      state = table[(state << 8) | b]
+  return total + state
+
+
+# POWERS_OF_17[k] = 17**k mod 256. 17 = 1+16, so these repeat every 16.
+# 17 is odd, so it also has an inverse mod 256.
+POWERS_OF_17 = [pow(17, k, 256) for k in range(16)]
+INVERSE_POWERS_OF_17 = [pow(17, -k, 256) for k in range(16)]
+
+
+def hashSumNumpy(buf):
+  """
+  Same as hashSumBytes(), using numpy on the whole buffer at once.
+
+  Unrolling the HASH of a token whose bytes are at positions j, ending
+  at a separator at position e, gives
+    sum(b[j] * 17**(e-j)) = 17**e * sum(b[j] * 17**-j)   (mod 256)
+  so each byte is weighted by its own position alone, the per-token
+  sums come from np.add.reduceat, and each sum is scaled by 17**e.
+  All the arithmetic is on uint8 arrays, which wrap mod 256 for free.
+  """
+  a = np.frombuffer(buf, dtype=np.uint8)
+  n = len(a)
+  if n == 0:
+    return 0
+
+  separator_table = np.zeros(256, dtype=bool)
+  separator_table[list(SEPARATORS)] = True
+  is_sep = separator_table[a]
+
+  weights = np.tile(np.array(INVERSE_POWERS_OF_17, dtype=np.uint8), n // 16 + 1)
+  contrib = a * weights[:n]
+  contrib[is_sep] = 0
+
+  seps = np.flatnonzero(is_sep)
+  starts = np.append(0, seps + 1)
+  ends = np.append(seps, n)
+  # a separator at the very end starts an empty token; drop it
+  if starts[-1] == n:
+    starts = starts[:-1]
+    ends = ends[:-1]
+  sums = np.add.reduceat(contrib, starts, dtype=np.uint8)
+  hashes = sums * np.array(POWERS_OF_17, dtype=np.uint8)[ends % 16]
+  return int(hashes.sum(dtype=np.int64))
+
+
+def hashSum(filename, chunk_size = 1 << 26):
+  """
+  Sum of HASH over a file of comma-separated tokens, read through an
+  mmap. The file is handled in chunks of about chunk_size bytes, each
+  cut just after a comma so no token is split, so memory use stays
+  bounded however large the file is.
+  """
+  total = 0
+  with open(filename, 'rb') as inf:
+    # an empty file can't be mapped
+    if os.fstat(inf.fileno()).st_size == 0:
+      return 0
+    with mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+      start = 0
+      while start < len(mm):
+        end = min(start + chunk_size, len(mm))
+        # cut just after a comma
+        if end < len(mm):
+          cut = mm.rfind(b',', start, end)
+          if cut < 0:
+            # one token longer than a chunk
+            cut = mm.find(b',', end)
+          end = cut + 1 if cut >= 0 else len(mm)
+        with memoryview(mm)[start:end] as chunk:
+          if np is not None:
+            total += hashSumNumpy(chunk)
+          else:
+            total += hashSumBytes(chunk)
+        start = end
+  return total
+
+
 def part1(filename):
-  with open(filename) as inf:
-    sum = 0
-    for line in inf:
-      words = line.split(',')
-      for word in words:
-        sum += hashString(word.strip())
-  print(f'part1 {sum}')
+  print(f'part1 {hashSum(filename)}')
 
 
 cmd_re = re.compile(r'([a-z]+)(-|=)(\d*)')
@@ -77,11 +177,140 @@ def focusingPower(table):
       sum += (box_id + 1) * slot_id * slot[1]
   return sum
     
-def part2(filename):
-  sum = 0
+class FenwickTree:
+  """
+  Prefix sums over a list of numbers that only grows at the end, with
+  O(log n) point updates and prefix queries.
+  """
+  def __init__(self, values = ()):
+    # 1-based; tree[i] holds the sum of the (i & -i) values ending at i
+    self.tree = [0]
+    self.tree.extend(values)
+    self.total = sum(values)
+    # build in O(n) by pushing each partial sum up to its parent
+    for i in range(1, len(self.tree)):
+      parent = i + (i & -i)
+      if parent < len(self.tree):
+        self.tree[parent] += self.tree[i]
+
+  def __len__(self):
+    return len(self.tree) - 1
+
+  def append(self, value):
+    i = len(self.tree)
+    self.tree.append(value + self.prefix(i-1) - self.prefix(i - (i & -i)))
+    self.total += value
+
+  def add(self, index, delta):
+    """
+    Add delta to the value at 0-based index.
+    """
+    self.total += delta
+    i = index + 1
+    while i < len(self.tree):
+      self.tree[i] += delta
+      i += i & -i
+
+  def prefix(self, n):
+    """
+    Sum of the first n values.
+    """
+    sum = 0
+    while n > 0:
+      sum += self.tree[n]
+      n -= n & -n
+    return sum
+
+
+class LensTable:
+  """
+  The boxes of lenses, with the focusing power kept up to date after
+  every operation, so it can be read at any point in a stream of
+  commands.
+
+  Each box is a dict from label to [seq, focal_length]. Dicts keep
+  insertion order, and replacing a value keeps its position, so a
+  box's dict order is its slot order, and finding a label is O(1)
+  rather than a scan of the box.
 
-  # each entry in table is a list of [key, value] pairs
-  table = [[] for _ in range(256)]
+  seq numbers the lenses put into each box, in order. Removing a lens
+  moves every later lens in its box down one slot, so the power drops
+  by the removed lens's own term plus the focal lengths of all the
+  lenses after it. Two Fenwick trees per box, indexed by seq, give the
+  lens's slot (the live lenses up to it) and that suffix sum in
+  O(log n), instead of renumbering the box.
+
+  Removed lenses leave zeros in the trees, so when they outnumber the
+  live lenses in a box, the box is renumbered from its dict order and
+  its trees are rebuilt. That keeps the trees proportional to the
+  lenses actually in the box, however long the stream of commands.
+  """
+  def __init__(self, box_count = 256):
+    self.boxes = [{} for _ in range(box_count)]
+    self.live = [FenwickTree() for _ in range(box_count)]
+    self.focals = [FenwickTree() for _ in range(box_count)]
+    self.power = 0
+
+  def assign(self, key, value):
+    box_id = hashString(key)
+    box = self.boxes[box_id]
+    entry = box.get(key)
+    if entry:
+      (seq, old_value) = entry
+      slot = self.live[box_id].prefix(seq + 1)
+      self.focals[box_id].add(seq, value - old_value)
+      entry[1] = value
+      self.power += (box_id + 1) * slot * (value - old_value)
+    else:
+      slot = len(box) + 1
+      box[key] = [len(self.live[box_id]), value]
+      self.live[box_id].append(1)
+      self.focals[box_id].append(value)
+      self.power += (box_id + 1) * slot * value
+
+  def remove(self, key):
+    box_id = hashString(key)
+    entry = self.boxes[box_id].pop(key, None)
+    if not entry: return
+    (seq, value) = entry
+    live = self.live[box_id]
+    focals = self.focals[box_id]
+    slot = live.prefix(seq + 1)
+    after = focals.total - focals.prefix(seq + 1)
+    live.add(seq, -1)
+    focals.add(seq, -value)
+    self.power -= (box_id + 1) * (slot * value + after)
+
+    if len(live) > 2 * len(self.boxes[box_id]):
+      self.compact(box_id)
+
+  def compact(self, box_id):
+    """
+    Renumber the lenses in a box 0..n-1 and rebuild its trees without
+    the removed lenses.
+    """
+    box = self.boxes[box_id]
+    values = []
+    for seq, entry in enumerate(box.values()):
+      entry[0] = seq
+      values.append(entry[1])
+    self.live[box_id] = FenwickTree([1] * len(values))
+    self.focals[box_id] = FenwickTree(values)
+
+  def focusingPower(self):
+    return self.power
+
+  def toTable(self):
+    """
+    Return the boxes as lists of [key, value] pairs, for printTable()
+    and focusingPower().
+    """
+    return [[[key, entry[1]] for key, entry in box.items()]
+            for box in self.boxes]
+
+
+def part2(filename):
+  table = LensTable()
 
   with open(filename) as inf:
     for line in inf:
@@ -93,19 +322,18 @@ def part2(filename):
           print('Unrecognized command: ' + cmd)
           sys.exit(1)
         key = m.group(1)
-        slot = hashString(key)
         op = m.group(2)
         if op == '=':
           value = int(m.group(3))
-          assignValue(table[slot], key, value)
+          table.assign(key, value)
         elif op == '-':
-          removeValue(table[slot], key)
+          table.remove(key)
         else:
           print(f'invalid op "{op}"')
           sys.exit(1)
 
-        # printTable(table)
-  print(f'part2 {focusingPower(table)}')
+        # printTable(table.toTable())
+  print(f'part2 {table.focusingPower()}')
 
 
 if __name__ == '__main__':
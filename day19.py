@@ -9,6 +9,7 @@ Ed Karrels, ed.karrels@gmail.com, January 2024
 """
 
 import sys, re, collections, time
+from intervals import IntervalSet
 
 workflow_re = re.compile(r'([a-z]+){(.*)}')
 rule_re = re.compile(r'([xmas])([<>])(\d+):(A|R|[a-z]+)')
@@ -149,7 +150,7 @@ def traverseWorkflows(workflows, visits, order, name):
 def partRangeSize(p):
   prod = 1
   for r in p:
-    prod *= (r[1] - r[0])
+    prod *= r.size()
   return prod
 
 def traverseAcceptTree(workflows, name, part_ranges, stack, accept):
@@ -170,18 +171,20 @@ def traverseAcceptTree(workflows, name, part_ranges, stack, accept):
   for rule in node[0]:
     r = part_ranges[rule.rating_idx]
     if rule.compare_symbol == '<':
+      below, above = r.split(rule.value)
       # if all remaining values are already out of range, skip this
-      if rule.value <= r[0]:
+      if below.isEmpty():
         continue
-      part_ranges[rule.rating_idx] = (r[0], rule.value)
+      part_ranges[rule.rating_idx] = below
       traverseAcceptTree(workflows, rule.dest, part_ranges, stack, accept)
-      part_ranges[rule.rating_idx] = (rule.value, r[1])
+      part_ranges[rule.rating_idx] = above
     else:
-      if rule.value+1 >= r[1]:
+      below, above = r.split(rule.value+1)
+      if above.isEmpty():
         continue
-      part_ranges[rule.rating_idx] = (rule.value+1, r[1])
+      part_ranges[rule.rating_idx] = above
       traverseAcceptTree(workflows, rule.dest, part_ranges, stack, accept)
-      part_ranges[rule.rating_idx] = (r[0], rule.value+1)
+      part_ranges[rule.rating_idx] = below
 
   traverseAcceptTree(workflows, node[1], part_ranges, stack, accept)
   del(stack[-1])
@@ -263,7 +266,7 @@ def part2(workflows, parts):
   # Great! This means we can use a much simpler approach.
 
   accept = [0]
-  part_ranges = [(1, 4001), (1, 4001), (1, 4001), (1, 4001)]
+  part_ranges = [IntervalSet([(1, 4001)]) for _ in range(4)]
   stack = []
   traverseAcceptTree(workflows, 'in', part_ranges, stack, accept)
   print(f'part2 {accept[0]}')
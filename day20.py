@@ -11,6 +11,7 @@ Ed Karrels, ed.karrels@gmail.com, January 2024
 
 import sys, re, collections, time, math
 from collections import deque, namedtuple
+from common import findCycle
 
 
 button_press_idx = 0
@@ -303,6 +304,27 @@ def part1(filename):
   print(f'part1 {pulse_count_prod}')
 
 
+def stateCycle(filename, max_presses = None):
+  """
+  Find when the state of the whole circuit starts repeating under
+  button presses, using Brent's algorithm on Circuit.getState().
+  Returns (mu, lambda), or None if there is no repeat within max_presses.
+
+  This works on small circuits like the examples. For the real input
+  the cycle is the product of the counters' cycles, far too long to
+  simulate, which is why part2 watches the key gates instead.
+  """
+  def makeCircuit():
+    with open(filename) as inf:
+      return readInput(inf)
+
+  def press(circuit):
+    circuit.pressButton()
+    return circuit
+
+  return findCycle(makeCircuit, press, Circuit.getState, max_presses)
+
+
 def inputsOf(dest_gate, circuit):
   inputs = set()
   for gate in circuit.gate_list:
@@ -9,6 +9,7 @@ Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
 import sys, bisect
+from intervals import IntervalSet
 
 class Mapping:
   def __init__(self, name):
@@ -78,63 +79,82 @@ class Mapping:
     else:
       return mapping[1] + key - mapping[0]
 
+  def segments(self, lo, hi):
+    """
+    Split [lo, hi) into pieces that each have a constant offset under
+    this mapping. Yields (start, end, offset) tuples in order, including
+    the unmapped gaps between entries, which have an offset of 0.
+    """
+    i = max(0, bisect.bisect_right(self.key_list, lo) - 1)
+    pos = lo
+    while pos < hi:
+      if i == len(self.mapping_list):
+        yield (pos, hi, 0)
+        return
+      (src_start, dest_start, length) = self.mapping_list[i]
+      src_end = src_start + length
+      if src_end <= pos:
+        i += 1
+      elif src_start > pos:
+        end = min(hi, src_start)
+        yield (pos, end, 0)
+        pos = end
+      else:
+        end = min(hi, src_end)
+        yield (pos, end, dest_start - src_start)
+        pos = end
+        i += 1
 
-class RangeList:
-  def __init__(self):
-    self.range_list = []
-
-  def add(self, start, length):
-    self.range_list.append([start, length])
-
-  def size(self):
-    return sum([r[1] for r in self.range_list])
-
-  def isValid(self):
-    for i in range(1, len(self.range_list)):
-      r = self.range_list[i]
-      prev = self.range_list[i-1]
-      if r[0] < prev[0] + prev[1]: return False
-    return True
+  def compose(self, other):
+    """
+    Return a new Mapping equivalent to applying this mapping and then
+    other, so result.lookup(x) == other.lookup(self.lookup(x)).
 
-  def search(self, point):
+    Outside the span of both mappings every point maps to itself, so
+    only that span needs to be walked. Each constant-offset piece of
+    this mapping is pushed through other and split at its boundaries.
+    Pieces that end up with an offset of 0 are left out.
     """
-    If the given point is within one of the ranges, return the index
-    of that range. Otherwise return -1.
+    result = Mapping(f'{self.name}+{other.name}')
+    bounds = [(m[0], m[0] + m[2])
+              for m in self.mapping_list + other.mapping_list]
+    if not bounds:
+      result.compile()
+      return result
+    lo = min(b[0] for b in bounds)
+    hi = max(b[1] for b in bounds)
+
+    for (start, end, offset) in self.segments(lo, hi):
+      for (start2, end2, offset2) in other.segments(start + offset, end + offset):
+        total = offset + offset2
+        if total == 0: continue
+        src_start = start2 - offset
+        length = end2 - start2
+        # merge with the previous entry if it continues it
+        if result.mapping_list:
+          (p_src, p_dest, p_len) = result.mapping_list[-1]
+          if p_src + p_len == src_start and p_dest - p_src == total:
+            result.mapping_list[-1] = (p_src, p_dest, p_len + length)
+            continue
+        result.add(src_start, src_start + total, length)
+
+    result.compile()
+    return result
+
+  def inverse(self):
     """
-    for i, r in enumerate(self.range_list):
-      if point >= r[0] and point < r[0] + r[1]:
-        return i
-    return -1
-    
-  
-  def compile(self):
-    """
-    Put all the ranges in order and coalesce overlaps.
+    Return the Mapping that undoes this one. This is only meaningful
+    if the mapping is one-to-one, which means the destination ranges
+    don't overlap each other and unmapped points don't collide with
+    mapped ones.
     """
-    self.range_list.sort()
-    i = 0
-    while i < len(self.range_list) - 1:
-      r = self.range_list[i]
-      next = self.range_list[i+1]
-
-      # check that the list is ordered
-      assert r[0] <= next[0]
-
-      # n overlap
-      if r[0] + r[1] < next[0]:
-        i += 1
-        continue
-
-      # compile r and next
-      end = max(r[0] + r[1], next[0] + next[1])
-      r[1] = end - r[0]
-      del(self.range_list[i+1])
+    result = Mapping(f'inverse {self.name}')
+    for src_start, dest_start, length in self.mapping_list:
+      result.add(dest_start, src_start, length)
+    result.compile()
+    assert result.isValid()
+    return result
 
-  def print(self, title):
-    print('RangeList ' + title)
-    for (start, length) in self.range_list:
-      print(f'  {start:,} .. {start+length:,}')
-      
 
 def readInput(inf):
   line = inf.readline()
@@ -195,76 +215,148 @@ def seedToLocation(seed, mapping_list):
   return i
 
 
-def remapRangeList2(range_list, mapping):
+def composeMappings(mapping_list):
+  """
+  Fold a chain of mappings into one Mapping, so a single bisect
+  replaces one lookup per layer.
+  """
+  composed = mapping_list[0]
+  for mapping in mapping_list[1:]:
+    composed = composed.compose(mapping)
+  return composed
+
+
+def minLocation(ranges, location_map):
+  """
+  Return the smallest location any point in the IntervalSet ranges maps to.
+  Within each constant-offset piece of the composed map the smallest
+  output is at the start of the piece, so only the breakpoints that
+  fall inside the ranges need to be checked.
+  """
+  min_location = None
+  for start, end in ranges:
+    for (seg_start, seg_end, offset) in location_map.segments(start, end):
+      location = seg_start + offset
+      if min_location == None or location < min_location:
+        min_location = location
+  return min_location
+
+
+def batchSeedToLocation(seeds, mapping_list, chunk_size = 1 << 20):
+  """
+  Map a whole array of seeds to locations at once with NumPy.
+  Returns (locations, argmin) where argmin is the index of the seed with
+  the smallest location.
+
+  seeds can be a NumPy array, any sequence of ints, or the name of a
+  file. A .npy file is loaded with mmap_mode='r', and anything else is
+  memory-mapped as raw int64 values, so seed files larger than memory
+  can be scanned. They are processed chunk_size seeds at a time.
+
+  mapping_list can be the full chain of layers, or [composeMappings(...)].
+  """
+  # numpy is only needed for this function
+  import numpy as np
+
+  if isinstance(seeds, str):
+    if seeds.endswith('.npy'):
+      seeds = np.load(seeds, mmap_mode='r')
+    else:
+      seeds = np.memmap(seeds, dtype=np.int64, mode='r')
+  else:
+    seeds = np.asarray(seeds, dtype=np.int64)
+
+  # per layer: sorted src_start keys, src_end, and dest-src offsets
+  tables = []
+  for mapping in mapping_list:
+    keys = np.array(mapping.key_list, dtype=np.int64)
+    ends = np.array([m[0] + m[2] for m in mapping.mapping_list], dtype=np.int64)
+    offsets = np.array([m[1] - m[0] for m in mapping.mapping_list], dtype=np.int64)
+    tables.append((keys, ends, offsets))
+
+  locations = np.empty(len(seeds), dtype=np.int64)
+  for chunk_start in range(0, len(seeds), chunk_size):
+    values = np.array(seeds[chunk_start:chunk_start+chunk_size], dtype=np.int64)
+    for (keys, ends, offsets) in tables:
+      if len(keys) == 0: continue
+      # index of the last entry with src_start <= value, or -1
+      i = np.searchsorted(keys, values, side='right') - 1
+      ic = np.maximum(i, 0)
+      inside = (i >= 0) & (values < ends[ic])
+      np.add(values, offsets[ic], out=values, where=inside)
+    locations[chunk_start:chunk_start+len(values)] = values
+
+  if len(locations) == 0:
+    return (locations, None)
+  return (locations, int(np.argmin(locations)))
+
+
+def remapRangeList2(ranges, mapping):
   """
-  do a kind of merge on the range list and mapping list
+  Sweep through an IntervalSet and the mapping list together, like the
+  merge step of a merge sort. Both are sorted and nonoverlapping, so
+  the mapping index never moves backwards. Each input range is split
+  at mapping boundaries, and each piece is shifted by the offset of the
+  mapping that covers it (or left alone if no mapping covers it).
+
+  This is O(R+M) for the sweep plus a sort of the output pieces when
+  they are collected into the resulting IntervalSet.
   """
-  output_range_list = RangeList()
-  input_range_list = range_list.range_list
+  pieces = []
   mapping_list = mapping.mapping_list
 
-  # first check that the list of ranges are ordered and non-overlapping
-  assert range_list.isValid()
+  # first check that the mapping list is ordered and non-overlapping
   assert mapping.isValid()
-  
-  # collect all the start/end point from either set of ranges
-  points = set()
-  for r in input_range_list:
-    points.add(r[0])
-    points.add(r[0] + r[1])
-  for m in mapping_list:
-    points.add(m[0])
-    points.add(m[0] + m[2])
-
-  points = list(points)
-  points.sort()
-  # print(f'points: {points}')
-
-  for i in range(1, len(points)):
-    start = points[i-1]
-    length = points[i] - start
-    ri = range_list.search(start)
-    # ignore anything that isn't in the input range
-    if ri != -1:
-      mi = mapping.search(start)
-      if mi != -1:
-        # remapped subrange
-        m = mapping_list[mi]
-        offset = m[1] - m[0]
-        output_range_list.add(start + offset, length)
-      else:
-        output_range_list.add(start, length)
-  
-  output_range_list.compile()
-  return output_range_list
+
+  mi = 0
+  for pos, end in ranges:
+    while pos < end:
+      # skip mappings that end at or before pos
+      while mi < len(mapping_list) and mapping_list[mi][0] + mapping_list[mi][2] <= pos:
+        mi += 1
+
+      if mi == len(mapping_list) or mapping_list[mi][0] >= end:
+        # the rest of this range is not remapped
+        pieces.append((pos, end))
+        break
+
+      (src_start, dest_start, m_length) = mapping_list[mi]
+
+      # unmapped gap before the mapping starts
+      if src_start > pos:
+        pieces.append((pos, src_start))
+        pos = src_start
+
+      # remapped subrange
+      sub_end = min(end, src_start + m_length)
+      offset = dest_start - src_start
+      pieces.append((pos + offset, sub_end + offset))
+      pos = sub_end
+
+  return IntervalSet(pieces)
 
     
-def part1(seed_list, mapping_list):
+def part1(seed_list, location_map):
   min_location = None
   for seed in seed_list:
-    location = seedToLocation(seed, mapping_list)
+    location = location_map.lookup(seed)
     if min_location == None or location < min_location:
       min_location = location
 
   print(f'part1 {min_location}')
 
 
-def part2(seed_list, mapping_list):
-  min_location = None
-  ranges = RangeList()
+def part2(seed_list, location_map):
+  pairs = []
   for i in range(0, len(seed_list), 2):
     start = seed_list[i]
     length = seed_list[i+1]
-    ranges.add(start, length)
+    pairs.append((start, start + length))
     # print(f'seeds {start_seed_idx} .. {start_seed_idx+length}')
-  ranges.compile()
+  ranges = IntervalSet(pairs)
   # ranges.print(f'Seeds size={ranges.size()}')
 
-  for mi, m in enumerate(mapping_list):
-    ranges = remapRangeList2(ranges, m)
-    # ranges.print(f'ranges after map {mi}, size={ranges.size()}')
-  
-  print(f'part2 {ranges.range_list[0][0]}')
+  print(f'part2 {minLocation(ranges, location_map)}')
 
 
 if __name__ == '__main__':
@@ -274,9 +366,11 @@ if __name__ == '__main__':
 
   with open(filename) as inf:
     (seed_list, mapping_list) = readInput(inf)
+
+  # combine all seven layers once, then every lookup is a single bisect
+  location_map = composeMappings(mapping_list)
     
-  part1(seed_list, mapping_list)
+  part1(seed_list, location_map)
 
-  part2(seed_list, mapping_list)
+  part2(seed_list, location_map)
   
-
@@ -23,7 +23,7 @@ def distFn(charge_time, time_avail):
   return (time_avail - charge_time) * charge_time
 
 
-def countWinnable(time, dist_to_beat):
+def countWinnableBrute(time, dist_to_beat):
   wins = 0
   for charge_time in range(1, time):
     dist = distFn(charge_time, time)
@@ -33,6 +33,40 @@ def countWinnable(time, dist_to_beat):
   return wins
 
 
+def countWinnable(time, dist_to_beat):
+  """
+  Count the charge times c in 1..time-1 with c * (time-c) > dist_to_beat,
+  without floating point, so it is exact for integers of any size.
+
+  math.isqrt gives the floor of the square root of the discriminant,
+  which puts the estimate of the lower root within a step of the true
+  boundary. The boundary is then corrected by checking distFn directly.
+  The winning charge times are symmetric around time/2, so the upper
+  boundary is time - lo.
+  """
+  if time < 2: return 0
+  disc = time * time - 4 * dist_to_beat
+  if disc < 0: return 0
+
+  lo = max(1, (time - math.isqrt(disc)) // 2)
+  while lo <= time // 2 and distFn(lo, time) <= dist_to_beat:
+    lo += 1
+  while lo > 1 and distFn(lo - 1, time) > dist_to_beat:
+    lo -= 1
+
+  hi = time - lo
+  if hi < lo: return 0
+  return hi - lo + 1
+
+
+def countWinnableBatch(races):
+  """
+  Given a list of (time, dist_to_beat) pairs, return a list with the
+  number of ways to win each race.
+  """
+  return [countWinnable(time, dist_to_beat) for time, dist_to_beat in races]
+
+
 def part1(filename):
   with open(filename) as inf:
     time_line = inf.readline().split()
@@ -46,11 +80,7 @@ def part1(filename):
   assert len(times) == len(dists)
 
   product = 1
-  for i in range(len(times)):
-    time = times[i]
-    dist_to_beat = dists[i]
-    wins = countWinnable(time, dist_to_beat)
-    # print(f'Given {time} ms, beat {dist_to_beat} mm {wins} ways')
+  for wins in countWinnableBatch(zip(times, dists)):
     product *= wins
   print(f'part1 {product}')
 
@@ -95,15 +125,13 @@ def part2(filename):
 
   >>> 48487379 - 11200895 + 1
   37286485
-  
+
+  math.sqrt loses precision once the values pass 2**53, so
+  countWinnable() does the same thing with math.isqrt and then fixes
+  up the boundary with exact integer checks.
   """
 
-  a = -1
-  b = time
-  c = -dist_to_beat
-  lo = math.ceil( (-b + math.sqrt(b**2 - 4 * a * c)) / (2*a) )
-  hi = math.floor( (-b - math.sqrt(b**2 - 4 * a * c)) / (2*a) )
-  print(f'part2 {hi - lo + 1}')
+  print(f'part2 {countWinnable(time, dist_to_beat)}')
   
 
 if __name__ == '__main__':
@@ -8,7 +8,8 @@ Simplified poker hands, with jokers.
 Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
-import sys
+import sys, os, mmap, itertools, hashlib, inspect
+from array import array
 
 HAND_HIGH_CARD = 0
 HAND_ONE_PAIR = 1
@@ -154,43 +155,173 @@ class Hand2:
 
   
 
-def part1(filename):
-  winnings = 0
+def handKey(hand, hand_type, values):
+  """
+  Encode a hand as one integer that sorts the same way the hands rank:
+  the hand type in the high bits, followed by the value of each card
+  in 4 bits apiece.
+  """
+  key = hand_type
+  for card in hand:
+    key = (key << 4) | values[card]
+  return key
+
+
+# 3 bits of hand type + 5 cards * 4 bits
+HAND_KEY_BITS = 23
+
+
+# There are only 13**5 possible hands, so the type of every one of them
+# can be precomputed. A hand is indexed by reading its cards as a
+# base-13 number.
+CARD_ORDER = '23456789TJQKA'
+card_index = {c: i for i, c in enumerate(CARD_ORDER)}
+HAND_COUNT = 13**5
+
+# kept next to this script, not in whatever directory it is run from
+HAND_TYPE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    'day7.hand_types.bin')
+HAND_TYPE_CACHE_MAGIC = b'day7 hand types\n'
+
+
+def handCode(hand):
+  code = 0
+  for card in hand:
+    code = code * 13 + card_index[card]
+  return code
+
+
+def buildHandTypeTables():
+  """
+  Returns (table, table2), each an array('B') of HAND_COUNT hand types
+  indexed by handCode(). table uses the standard rules and table2 uses
+  jokers.
+  """
+  table = array('B', bytes(HAND_COUNT))
+  table2 = array('B', bytes(HAND_COUNT))
+  # product() varies the last card fastest, which matches handCode()
+  for code, cards in enumerate(itertools.product(CARD_ORDER, repeat=5)):
+    hand = ''.join(cards)
+    table[code] = handType(hand)
+    table2[code] = handType2(hand)
+  return (table, table2)
+
+
+def handTypeTablesHeader():
+  """
+  The header for the cache file: a magic string and a checksum of the
+  code that generates the tables, so changing handType(), handType2(),
+  or the card numbering makes the old file stale.
+  """
+  digest = hashlib.sha256(CARD_ORDER.encode())
+  for fn in (handType, handType2, handCode, buildHandTypeTables):
+    try:
+      digest.update(inspect.getsource(fn).encode())
+    except OSError:
+      digest.update(fn.__code__.co_code)
+  return HAND_TYPE_CACHE_MAGIC + digest.digest()
+
+
+def loadHandTypeTables(cache_filename = HAND_TYPE_CACHE_FILE):
+  """
+  Memory-map the hand type tables from cache_filename, building and
+  saving them first if the file is missing, the wrong size, or was
+  made by different code (see handTypeTablesHeader).
+  Returns (table, table2) as memoryviews over the mapped file.
+  """
+  header = handTypeTablesHeader()
+  is_current = False
+  if os.path.exists(cache_filename):
+    with open(cache_filename, 'rb') as inf:
+      is_current = (inf.read(len(header)) == header
+                    and os.fstat(inf.fileno()).st_size
+                        == len(header) + 2 * HAND_COUNT)
+
+  if not is_current:
+    table, table2 = buildHandTypeTables()
+    # write to a temp file and rename, so a partial file is never seen
+    tmp_filename = cache_filename + '.tmp'
+    try:
+      with open(tmp_filename, 'wb') as outf:
+        outf.write(header)
+        outf.write(table.tobytes())
+        outf.write(table2.tobytes())
+      os.replace(tmp_filename, cache_filename)
+    except OSError:
+      # can't write next to the script; just use the tables in memory
+      return (memoryview(table), memoryview(table2))
+
+  with open(cache_filename, 'rb') as inf:
+    mapped = mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ)
+  view = memoryview(mapped)[len(header):]
+  return (view[:HAND_COUNT], view[HAND_COUNT:])
+
+
+def readHands(filename, tables = None):
+  """
+  Returns a list of (key, key2, bid) tuples, where key ranks the hand
+  under the standard rules and key2 ranks it with jokers.
+  If tables is given it should be the (table, table2) pair from
+  loadHandTypeTables(), and each hand is classified with one lookup.
+  """
+  hands = []
   with open(filename) as inf:
-    hands = []
     for line in inf:
       hand, bid = line.split()
-      h = Hand(hand, int(bid))
-      hands.append(h)
-      # t = handType(hand)
-      # print(f'{hand}: {t}')
-
-    hands.sort()
-    for i, hand in enumerate(hands):
-      w = hand.bid * (i+1)
-      # print(f'{i} {hand.hand} {hand.bid}*{i+1} = {w}')
-      winnings += w
+      if tables:
+        code = handCode(hand)
+        hand_type = tables[0][code]
+        hand_type2 = tables[1][code]
+      else:
+        hand_type = handType(hand)
+        hand_type2 = handType2(hand)
+      hands.append((handKey(hand, hand_type, card_value),
+                    handKey(hand, hand_type2, card_value2),
+                    int(bid)))
+  return hands
+
+
+def radixSort(pairs, key_bits = HAND_KEY_BITS, digit_bits = 12):
+  """
+  Sort a list of (key, value) pairs by key with an LSD radix sort.
+  Each pass is stable, so sorting on the low digit first leaves the
+  list ordered by the whole key.
+  """
+  bucket_count = 1 << digit_bits
+  mask = bucket_count - 1
+  for shift in range(0, key_bits, digit_bits):
+    buckets = [[] for _ in range(bucket_count)]
+    for pair in pairs:
+      buckets[(pair[0] >> shift) & mask].append(pair)
+    pairs = [pair for bucket in buckets for pair in bucket]
+  return pairs
+
+
+def totalWinnings(key_bid_list, use_radix_sort = False):
+  """
+  Given a list of (key, bid) pairs, rank the hands and sum bid*rank.
+
+  In CPython, sorted() with a key function still beat radixSort() in my
+  tests (0.53s vs 0.81s for a million hands), so the radix sort is off
+  by default.
+  """
+  if use_radix_sort:
+    ranked = radixSort(key_bid_list)
+  else:
+    ranked = sorted(key_bid_list, key = lambda pair: pair[0])
+  winnings = 0
+  for i, (key, bid) in enumerate(ranked):
+    winnings += bid * (i+1)
+  return winnings
+
+
+def part1(hands):
+  winnings = totalWinnings([(key, bid) for key, key2, bid in hands])
   print(f'part1 {winnings}')
   
 
-def part2(filename):
-  winnings = 0
-  with open(filename) as inf:
-    hands = []
-    for line in inf:
-      hand, bid = line.split()
-      # print(f'hand {hand} type {handType2(hand)}')
-      h = Hand2(hand, int(bid))
-      hands.append(h)
-      # t = handType(hand)
-      # print(f'{hand}: {t}')
-
-    hands.sort()
-    for i, hand in enumerate(hands):
-      w = hand.bid * (i+1)
-      # print(f'{i} {hand.hand} {hand.bid}*{i+1} = {w}')
-      winnings += w
-      
+def part2(hands):
+  winnings = totalWinnings([(key2, bid) for key, key2, bid in hands])
   print(f'part2 {winnings}')
   
 
@@ -198,5 +329,6 @@ if __name__ == '__main__':
   filename = 'day7.in.txt'
   if len(sys.argv) > 1:
     filename = sys.argv[1]
-  part1(filename)
-  part2(filename)
+  hands = readHands(filename, loadHandTypeTables())
+  part1(hands)
+  part2(hands)
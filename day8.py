@@ -51,29 +51,96 @@ def readInput(inf):
   return (nodes, turns)
   
 
+def compileNetwork(nodes):
+  """
+  Number the nodes. Returns (names, node_id, left, right), where
+  left[i] and right[i] are the ids of the nodes reached from node i.
+  """
+  names = list(nodes.keys())
+  node_id = {name: i for i, name in enumerate(names)}
+  left = [node_id[nodes[name].left.name] for name in names]
+  right = [node_id[nodes[name].right.name] for name in names]
+  return (names, node_id, left, right)
+
+
+class JumpTable:
+  """
+  The network compiled into integer node ids, with binary lifting
+  tables so that walks of huge numbers of steps cost O(log k).
+
+  step_table[r][i] is where node i ends up after r steps, starting at the
+  beginning of the turn string, for r in 0..len(turns). The last row is
+  where each node ends up after one full pass of the turns.
+
+  pass_table[j][i] is where node i ends up after 2**j full passes, and
+  end_table[j][i] is True if an end node is reached on any step of
+  those passes.
+  """
+  def __init__(self, nodes, turns, is_end, max_levels = 64):
+    self.turns = turns
+    (self.names, self.node_id, left, right) = compileNetwork(nodes)
+    self.is_end = [is_end(nodes[name]) for name in self.names]
+    n = len(self.names)
+
+    # first_end[i] = first step 1..len(turns) in a pass starting at i
+    # that lands on an end node, or None
+    self.first_end = [None] * n
+    row = list(range(n))
+    self.step_table = [row]
+    for step, turn in enumerate(turns, 1):
+      next_node = left if turn == 'L' else right
+      row = [next_node[x] for x in row]
+      self.step_table.append(row)
+      for i, x in enumerate(row):
+        if self.is_end[x] and self.first_end[i] == None:
+          self.first_end[i] = step
+
+    self.pass_table = [self.step_table[-1]]
+    self.end_table = [[x != None for x in self.first_end]]
+    for _ in range(1, max_levels):
+      prev_pass = self.pass_table[-1]
+      prev_end = self.end_table[-1]
+      self.pass_table.append([prev_pass[prev_pass[i]] for i in range(n)])
+      self.end_table.append([prev_end[i] or prev_end[prev_pass[i]]
+                             for i in range(n)])
+
+  def nodeAfter(self, start_name, steps):
+    """
+    Return the name of the node reached after the given number of steps.
+    """
+    passes, remainder = divmod(steps, len(self.turns))
+    node = self.node_id[start_name]
+    level = 0
+    while passes:
+      if passes & 1:
+        node = self.pass_table[level][node]
+      passes >>= 1
+      level += 1
+    return self.names[self.step_table[remainder][node]]
+
+  def stepsToEnd(self, start_name):
+    """
+    Return the number of steps until an end node is first reached, or
+    None if that never happens within 2**max_levels passes.
+    """
+    node = self.node_id[start_name]
+    passes = 0
+    # skip the largest number of passes that doesn't reach an end node
+    for level in range(len(self.pass_table)-1, -1, -1):
+      if not self.end_table[level][node]:
+        node = self.pass_table[level][node]
+        passes += 1 << level
+    if self.first_end[node] == None:
+      return None
+    return passes * len(self.turns) + self.first_end[node]
+
+
 def part1(filename):
   with open(filename) as inf:
     (nodes, turns) = readInput(inf)
-  
-  # print(repr(nodes))
-  steps = 0
-  node = nodes['AAA']
-  turn_pos = 0
-  # print('AAA')
-  while node.name != 'ZZZ':
-    turn = turns[turn_pos]
-    turn_pos += 1
-    if turn_pos == len(turns):
-      turn_pos = 0
 
-    if turn == 'L':
-      node = node.left
-    else:
-      assert turn == 'R'
-      node = node.right
-    steps += 1
-    
-    # print(f'{steps}. {node.name}')
+  jumps = JumpTable(nodes, turns, lambda node: node.name == 'ZZZ')
+  steps = jumps.stepsToEnd('AAA')
   print(f'part1 {steps}')
 
 
@@ -123,21 +190,133 @@ class Path:
     return ' '.join([f'({str(s[0])}, {s[1].name})' for s in self.cycle_list])
 
 
+class GhostCycle:
+  """
+  The state of a ghost is (node, turn position), so its walk must
+  eventually repeat. Its first mu steps are the pre-period, after which
+  it repeats every lam steps.
+
+  pre_ends is the set of steps t < mu where the ghost is on an end node.
+  cycle_ends is the set of offsets o in 0..lam-1 such that the ghost is
+  on an end node at every step mu + o + k*lam.
+  """
+  def __init__(self, name, mu, lam, end_steps):
+    self.name = name
+    self.mu = mu
+    self.lam = lam
+    self.pre_ends = set(t for t in end_steps if t < mu)
+    self.cycle_ends = set(t - mu for t in end_steps if t >= mu)
+
+  def isEnd(self, t):
+    if t < self.mu:
+      return t in self.pre_ends
+    return (t - self.mu) % self.lam in self.cycle_ends
+
+  def __str__(self):
+    return f'{self.name} mu={self.mu} lambda={self.lam} pre={sorted(self.pre_ends)} cycle={sorted(self.cycle_ends)}'
+
+
+def findGhostCycles(nodes, turns):
+  """
+  Walk every start node in lockstep until each one revisits a
+  (node, turn position) state. Returns a list of GhostCycle objects.
+  """
+  (names, node_id, left, right) = compileNetwork(nodes)
+  n = len(names)
+  is_end = [isEndNode(nodes[name]) for name in names]
+  turn_next = [left if turn == 'L' else right for turn in turns]
+
+  starts = [node_id[name] for name in names if isStartNode(nodes[name])]
+  current = starts.copy()
+  # first_seen[g][turn_pos * n + node] = step when ghost g was there, or -1
+  first_seen = [[-1] * (n * len(turns)) for _ in starts]
+  end_steps = [[] for _ in starts]
+  cycles = [None] * len(starts)
+  active = list(range(len(starts)))
+
+  step = 0
+  turn_pos = 0
+  while active:
+    still_active = []
+    next_node = turn_next[turn_pos]
+    for g in active:
+      node = current[g]
+      state = turn_pos * n + node
+      seen = first_seen[g][state]
+      if seen >= 0:
+        cycles[g] = GhostCycle(names[starts[g]], seen, step - seen, end_steps[g])
+        continue
+      first_seen[g][state] = step
+      if is_end[node]:
+        end_steps[g].append(step)
+      current[g] = next_node[node]
+      still_active.append(g)
+    active = still_active
+    step += 1
+    turn_pos += 1
+    if turn_pos == len(turns):
+      turn_pos = 0
+
+  return cycles
+
+
+def combineCongruences(a, m, b, n):
+  """
+  Generalized Chinese remainder theorem: solve x = a (mod m) and
+  x = b (mod n) where m and n need not be coprime.
+  Returns (x, lcm(m, n)), or None if there is no solution.
+  """
+  g = math.gcd(m, n)
+  if (b - a) % g != 0:
+    return None
+  k = ((b - a) // g * pow(m // g, -1, n // g)) % (n // g)
+  lcm = m // g * n
+  return ((a + m * k) % lcm, lcm)
+
+
+def firstCommonEnd(cycles):
+  """
+  Return the first step >= 1 at which every ghost is on an end node,
+  or None if that never happens.
+  """
+  start = max(c.mu for c in cycles)
+
+  # Before every ghost is in its cycle, the only candidates are the
+  # pre-period end steps of the ghost with the longest pre-period.
+  slowest = max(cycles, key = lambda c: c.mu)
+  for t in sorted(slowest.pre_ends):
+    if t >= 1 and all(c.isEnd(t) for c in cycles):
+      return t
+
+  # After that each ghost is on an end node at t = mu + o (mod lam) for
+  # each offset o. Combine every choice of offsets with the CRT.
+  solutions = [(0, 1)]
+  for c in cycles:
+    new_solutions = set()
+    for (r, m) in solutions:
+      for o in c.cycle_ends:
+        combined = combineCongruences(r, m, (c.mu + o) % c.lam, c.lam)
+        if combined:
+          new_solutions.add(combined)
+    solutions = new_solutions
+
+  best = None
+  lower = max(start, 1)
+  for (r, m) in solutions:
+    # smallest t >= lower with t = r (mod m)
+    t = r + (lower - r + m - 1) // m * m if r < lower else r
+    if best == None or t < best:
+      best = t
+  return best
+
+
 def part2(filename):
   with open(filename) as inf:
     (nodes, turns) = readInput(inf)
 
-  cycle_lengths = []
-
-  for node in nodes.values():
-    if not isStartNode(node): continue
-    path = Path(node)
-    path.findCycles(nodes, turns)
-    # print(f'{node.name} path: {path}')
-    cycle_len = path.cycle_list[0][0]
-    cycle_lengths.append(cycle_len)
-  lcm = math.lcm(*cycle_lengths)
-  print(f'part2 {lcm}')
+  cycles = findGhostCycles(nodes, turns)
+  # for c in cycles: print(c)
+  print(f'part2 {firstCommonEnd(cycles)}')
     
   
 if __name__ == '__main__':
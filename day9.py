@@ -8,7 +8,7 @@ Polynomial extrapolation
 Ed Karrels, ed.karrels@gmail.com, December 2023
 """
 
-import sys
+import sys, math, functools, collections
 
 
 def allZero(row):
@@ -76,9 +76,80 @@ def part2(filename):
   print(f'part2 {exsum}')
 
 
+@functools.lru_cache(maxsize=None)
+def lagrangeWeights(n, x):
+  """
+  If a polynomial of degree < n has values y[0..n-1] at 0..n-1, its value
+  at x is sum(w[i] * y[i]) with these weights. They are the Lagrange
+  basis polynomials evaluated at x, which are always integers for
+  integer x. For x = n they are the alternating binomial coefficients
+  (-1)**(n-1-i) * C(n, i).
+  """
+  weights = []
+  for i in range(n):
+    numerator = 1
+    for j in range(n):
+      if j != i:
+        numerator *= x - j
+    denominator = math.factorial(i) * math.factorial(n-1-i)
+    if (n-1-i) & 1:
+      denominator = -denominator
+    weights.append(numerator // denominator)
+  return tuple(weights)
+
+
+@functools.lru_cache(maxsize=None)
+def lastDiffWeights(n):
+  """
+  Weights that compute the single value in the last row of the
+  difference table. If it's nonzero, the table never resolves to zeros.
+  """
+  return tuple((-1)**(n-1-i) * math.comb(n-1, i) for i in range(n))
+
+
+def dot(weights, row):
+  return sum(w * y for w, y in zip(weights, row))
+
+
+def readHistories(filename):
+  with open(filename) as inf:
+    return [[int(x) for x in line.split()] for line in inf if line.strip()]
+
+
+def extrapolateBatch(histories, k = 1):
+  """
+  Extrapolate every history k steps past each end without building any
+  difference tables. Returns (next_sum, prev_sum), the sums of the
+  extrapolated values after the last entry and before the first.
+
+  The extrapolated values are fixed linear combinations of the inputs,
+  so histories are grouped by length and the resolved ones are summed
+  column by column. Each group then needs one dot product per direction.
+  """
+  groups = collections.defaultdict(list)
+  for row in histories:
+    groups[len(row)].append(row)
+
+  next_sum = prev_sum = 0
+  for n, rows in groups.items():
+    check = lastDiffWeights(n)
+    column_sums = [0] * n
+    for row in rows:
+      if dot(check, row) != 0:
+        print('Didnt resolve')
+        continue
+      for i, y in enumerate(row):
+        column_sums[i] += y
+    next_sum += dot(lagrangeWeights(n, n-1+k), column_sums)
+    prev_sum += dot(lagrangeWeights(n, -k), column_sums)
+
+  return (next_sum, prev_sum)
+
+
 if __name__ == '__main__':
   filename = 'day9.in.txt'
   if len(sys.argv) > 1:
     filename = sys.argv[1]
-  part1(filename)
-  part2(filename)
+  next_sum, prev_sum = extrapolateBatch(readHistories(filename))
+  print(f'part1 {next_sum}')
+  print(f'part2 {prev_sum}')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+"""
+A set of integers stored as sorted, nonoverlapping half-open intervals.
+Several puzzles (day 5 seed ranges, day 19 rating ranges) need to split
+and combine ranges, so this collects that logic in one place.
+"""
+
+import bisect, random, time
+
+class IntervalSet:
+  """
+  Intervals are half-open: [start, end). They are kept in two parallel
+  sorted lists, starts and ends. Overlapping or touching intervals are
+  always coalesced, so every boundary value is distinct and
+  starts[0] < ends[0] < starts[1] < ends[1] < ...
+
+  Membership is a binary search, and union, intersection and difference
+  are a single merge over the boundaries of both sets.
+  """
+  def __init__(self, pairs = None):
+    self.starts = []
+    self.ends = []
+    if pairs:
+      for start, end in sorted(pairs):
+        if start >= end: continue
+        if self.ends and start <= self.ends[-1]:
+          if end > self.ends[-1]:
+            self.ends[-1] = end
+        else:
+          self.starts.append(start)
+          self.ends.append(end)
+
+  @staticmethod
+  def fromSorted(starts, ends):
+    """
+    Wrap lists that are already sorted and coalesced, without copying
+    or checking them.
+    """
+    s = IntervalSet()
+    s.starts = starts
+    s.ends = ends
+    return s
+
+  def __len__(self):
+    # number of intervals, not number of points. See size().
+    return len(self.starts)
+
+  def __iter__(self):
+    return zip(self.starts, self.ends)
+
+  def __eq__(self, that):
+    return self.starts == that.starts and self.ends == that.ends
+
+  def __repr__(self):
+    return 'IntervalSet(' + repr(list(self)) + ')'
+
+  def isEmpty(self):
+    return not self.starts
+
+  def size(self):
+    """
+    Number of integers in the set.
+    """
+    return sum(self.ends) - sum(self.starts)
+
+  def min(self):
+    return self.starts[0]
+
+  def max(self):
+    # largest member, not the exclusive end
+    return self.ends[-1] - 1
+
+  def isValid(self):
+    if len(self.starts) != len(self.ends): return False
+    for i in range(len(self.starts)):
+      if self.starts[i] >= self.ends[i]: return False
+      if i > 0 and self.starts[i] <= self.ends[i-1]: return False
+    return True
+
+  def contains(self, x):
+    """
+    Return the index of the interval containing x, or -1.
+    """
+    i = bisect.bisect_right(self.starts, x) - 1
+    if i >= 0 and x < self.ends[i]:
+      return i
+    return -1
+
+  def __contains__(self, x):
+    return self.contains(x) != -1
+
+  def shift(self, offset):
+    return IntervalSet.fromSorted([x + offset for x in self.starts],
+                                  [x + offset for x in self.ends])
+
+  def split(self, value):
+    """
+    Return (below, above) where below has every member < value and
+    above has every member >= value.
+    """
+    i = bisect.bisect_right(self.starts, value)
+    below_starts = self.starts[:i]
+    below_ends = self.ends[:i]
+    above_starts = self.starts[i:]
+    above_ends = self.ends[i:]
+    # the interval before i may straddle value
+    if i > 0 and below_ends[-1] > value:
+      above_starts.insert(0, value)
+      above_ends.insert(0, below_ends[-1])
+      if below_starts[-1] == value:
+        below_starts.pop()
+        below_ends.pop()
+      else:
+        below_ends[-1] = value
+    return (IntervalSet.fromSorted(below_starts, below_ends),
+            IntervalSet.fromSorted(above_starts, above_ends))
+
+  def _combine(self, that, keep):
+    """
+    Merge the boundaries of both sets in order, tracking whether the
+    sweep is inside each one. keep(in_self, in_that) decides whether a
+    point is in the result.
+    """
+    a_starts, a_ends = self.starts, self.ends
+    b_starts, b_ends = that.starts, that.ends
+    na = 2 * len(a_starts)
+    nb = 2 * len(b_starts)
+    # boundary k of a set is starts[k//2] if k is even, else ends[k//2]
+    i = j = 0
+    in_a = in_b = inside = False
+    starts = []
+    ends = []
+    while i < na or j < nb:
+      a = (a_ends if i & 1 else a_starts)[i >> 1] if i < na else None
+      b = (b_ends if j & 1 else b_starts)[j >> 1] if j < nb else None
+      if b is None or (a is not None and a <= b):
+        x = a
+      else:
+        x = b
+      if a == x:
+        in_a = not in_a
+        i += 1
+      if b == x:
+        in_b = not in_b
+        j += 1
+      now = keep(in_a, in_b)
+      if now != inside:
+        if now:
+          starts.append(x)
+        else:
+          ends.append(x)
+        inside = now
+    return IntervalSet.fromSorted(starts, ends)
+
+  def union(self, that):
+    return self._combine(that, lambda a, b: a or b)
+
+  def intersection(self, that):
+    return self._combine(that, lambda a, b: a and b)
+
+  def difference(self, that):
+    return self._combine(that, lambda a, b: a and not b)
+
+  __or__ = union
+  __and__ = intersection
+  __sub__ = difference
+
+  def print(self, title):
+    print('IntervalSet ' + title)
+    for start, end in self:
+      print(f'  {start:,} .. {end:,}')
+
+
+def randomIntervalSet(count, universe):
+  pairs = []
+  for _ in range(count):
+    start = random.randrange(universe)
+    pairs.append((start, start + random.randrange(1, max(2, universe // count))))
+  return IntervalSet(pairs)
+
+
+def testIntervalSet():
+  universe = 60
+  for trial in range(2000):
+    a = randomIntervalSet(random.randint(0, 6), universe)
+    b = randomIntervalSet(random.randint(0, 6), universe)
+    a_points = {x for x in range(universe * 2) if x in a}
+    b_points = {x for x in range(universe * 2) if x in b}
+    assert a.isValid() and b.isValid()
+    assert a.size() == len(a_points)
+
+    for result, expected in ((a.union(b), a_points | b_points),
+                             (a.intersection(b), a_points & b_points),
+                             (a.difference(b), a_points - b_points),
+                             (a.shift(7), {x + 7 for x in a_points})):
+      assert result.isValid(), f'{a} {b} -> {result}'
+      assert IntervalSet([(x, x+1) for x in expected]) == result, f'{a} {b} -> {result}'
+
+    value = random.randrange(universe)
+    below, above = a.split(value)
+    assert below.isValid() and above.isValid()
+    assert below.union(above) == a
+    assert all(x < value for x in a_points if x in below)
+    assert all(x >= value for x in a_points if x in above)
+  print('all good')
+
+
+def benchmark(count = 200000, universe = 10**12):
+  a = randomIntervalSet(count, universe)
+  b = randomIntervalSet(count, universe)
+  print(f'{len(a)} and {len(b)} intervals')
+
+  for name, fn in (('union', a.union),
+                   ('intersection', a.intersection),
+                   ('difference', a.difference)):
+    start = time.time()
+    result = fn(b)
+    elapsed = time.time() - start
+    print(f'  {name:12} {elapsed*1000:8.1f} ms, {len(result)} intervals')
+
+  points = [random.randrange(universe) for _ in range(count)]
+  start = time.time()
+  hits = sum(1 for x in points if x in a)
+  elapsed = time.time() - start
+  print(f'  {"contains":12} {elapsed*1000:8.1f} ms for {count} lookups, {hits} hits')
+
+
+if __name__ == '__main__':
+  testIntervalSet()
+  benchmark()